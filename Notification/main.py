@@ -49,6 +49,9 @@ def post_time(post: json) -> str:
 def main():
     all_response = ""
     for xml_file in os.listdir("cache/xml"):
+        # skip the precompressed .gz / .br variants
+        if not xml_file.endswith(".xml"):
+            continue
         feed = feedparser.parse(f"cache/xml/{xml_file}")
 
         for post in feed.entries:
@@ -4,78 +4,398 @@ This also includes downloading everything from the feed and saving them locally,
 """
 import feedparser
 import os
-import urllib
 import hashlib
-import re
-import json
+import threading
+import tempfile
+import time
+import random
+import email.utils
+import contextlib
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 from typing import Optional
+from .validators import ValidatorStore
+from .store import AssetStore
+from .merge import merge_feed
+from .images import ImageOptimizer
+from .breaker import CircuitBreaker, CircuitOpen
+from .singleflight import SingleFlight
+from .negative import NegativeCache, KnownFailure, failure_class
+from .extract import extract_urls, raw_forms, url_matcher
+from Utils.http import client
+from Utils.catalog import FeedCatalog
+from Utils.publish import minify_xml
+from Utils.log import run_in_context
+from Utils.metrics import metrics
+from Utils.output import writer
 
-url_matcher = re.compile(
-    r'(?<=["])(?:http|https):\/\/[a-zA-Z0-9\?&%-=_\.\/]*(?=["])')
+chunk_size = 64 * 1024
 
-headers = {
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36 Edg/113.0.1774.57"
-}
+# exponential backoff between retries, in seconds
+retry_base_delay = 1
+retry_max_delay = 30
 
+breaker = CircuitBreaker()
 
-def repeat_download(url, max_retry=3):
+# asset urls that failed recently, skipped until their TTL runs out
+negative = NegativeCache()
+
+# downloads running in this run, shared by every feed, so a url is fetched once at a time
+inflight = SingleFlight()
+
+# per-host download slots, shared by every feed backed up in this run
+host_slots = {}
+host_slots_lock = threading.Lock()
+
+
+class NotModified(Exception):
+    """
+    Raised by repeat_download when a conditional request gets 304 Not Modified
+    """
+    pass
+
+
+class TooLarge(Exception):
+    """
+    Raised by repeat_download_to_temp when the response is larger than the size cap
+    """
+    # so the url is negative cached, and isn't streamed up to the cap again every run
+    failure_class = "permanent"
+    failure_reason = "too_large"
+
+
+def retry_after(response) -> Optional[float]:
+    """
+    Parse the Retry-After header of a response
+
+    :return: The seconds to wait, or None if there is no usable Retry-After
+    """
+    if response is None or response.headers.get("Retry-After") is None:
+        return None
+    value = response.headers["Retry-After"].strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_host_failure(e: Exception) -> bool:
+    """
+    Whether the exception means the host is unavailable (and not e.g. that a file is missing)
+    """
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and (e.response.status_code >= 500 or e.response.status_code == 429)
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
+def retry(func, url, max_retry):
+    """
+    Call func until it succeeds, with exponential backoff and jitter between tries
+
+    :param func: The download function to call, without arguments
+    :param str url: The url func downloads, used in error messages and for the host's circuit breaker
+    :param int max_retry: The maximum retry count
+
+    :return: What func returns
+    :raises NotModified: If func raises NotModified, never retried
+    :raises TooLarge: If func raises TooLarge, never retried
+    :raises CircuitOpen: If the host's circuit breaker is (or gets) open
+    :raises requests.HTTPError: If func got a permanent (4xx) error, never retried
+    :raises Exception: If the server asks to wait longer than retry_max_delay in Retry-After, raised from its error
+    :raises Exception: If func failed max_retry times, raised from the last error
+
+    :description:
+        Waits a random time up to retry_base_delay * 2^try (at most retry_max_delay) between tries,
+        or what the server asks for in Retry-After. A Retry-After over retry_max_delay is honored by giving up
+        on the url for this run instead of retrying early; the failure has already counted towards the breaker.
+        Host failures (connection errors, timeouts, 5xx, 429) count towards the host's circuit breaker.
+    """
+    host = urlparse(url).netloc
+    last_error = None
+    for retry_count in range(max_retry):
+        breaker.check(host)
+        try:
+            result = func()
+            breaker.success(host)
+            return result
+        except (NotModified, TooLarge):
+            raise
+        except Exception as e:
+            print("Error: " + str(e))
+            last_error = e
+            if failure_class(e) == "permanent":
+                raise
+            if is_host_failure(e) and breaker.failure(host) is not None:
+                raise CircuitOpen(host + " failed too many times, skipping it")
+            if retry_count == max_retry - 1:
+                break
+            delay = retry_after(getattr(e, "response", None))
+            if delay is not None and delay > retry_max_delay:
+                metrics.count("retries_given_up", reason="retry_after")
+                raise Exception(url + " asks to retry after " + format(delay, ".0f") +
+                                "s, more than " + str(retry_max_delay) + "s, giving up") from e
+            metrics.count("retries")
+            if delay is None:
+                delay = random.uniform(
+                    0, min(retry_max_delay, retry_base_delay * 2 ** retry_count))
+            print("Retrying in " + format(delay, ".1f") + "s...")
+            time.sleep(delay)
+    raise Exception("Failed to download " + url + " after " + str(max_retry) + " retries") from last_error
+
+
+def repeat_download(url, max_retry=3, extra_headers: Optional[dict] = None, return_headers: bool = False,
+                    warc=None):
     """
     Repeat downloading the xml until it succeeds
 
     :param str url: The url to download
     :param int max_retry: The maximum retry count
+    :param dict extra_headers: Headers sent on top of the default ones, like If-None-Match
+    :param bool return_headers: Also return the response headers
+    :param WARCWriter warc: Record the successful request / response pair in this archive
 
-    :return: The downloaded data
+    :return: The downloaded data, or (data, response headers) if return_headers is set
+    :raises NotModified: If the server answers 304 to a conditional request
     :raises Exception: If failed to download after max_retry retries
     """
-    for retry_count in range(max_retry):
+    def download():
+        with client.get(url, headers=extra_headers) as r:
+            if r.status_code == 304:
+                raise NotModified(url)
+            r.raise_for_status()
+            data = r.content
+            if warc is not None:
+                warc.write_response(r, data)
+        return (data, r.headers) if return_headers else data
+
+    return retry(download, url, max_retry)
+
+
+def repeat_download_to_temp(url, directory: str, max_size: Optional[int] = None, max_retry=3):
+    """
+    Repeat streaming the url into a temporary file in directory until it succeeds
+
+    :param str url: The url to download
+    :param str directory: The directory to create the temporary file in
+    :param int max_size: The maximum size in bytes, if not given, there is no limit
+    :param int max_retry: The maximum retry count
+
+    :return: (path of the temporary file, number of bytes, sha256 of the content, Content-Type)
+    :raises TooLarge: If the response is larger than max_size
+    :raises Exception: If failed to download after max_retry retries
+
+    :description:
+        The body is streamed in chunks and fsync'ed before returning,
+        the caller renames the file into place, so a crash never leaves a truncated file behind.
+    """
+    def download():
+        with client.get(url, stream=True) as r:
+            r.raise_for_status()
+            length = r.headers.get("Content-Length")
+            content_type = r.headers.get("Content-Type")
+            if max_size is not None and length is not None and length.isdigit() and int(length) > max_size:
+                raise TooLarge(url + " is " + length + " bytes")
+
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+            try:
+                size = 0
+                content_hash = hashlib.sha256()
+                with os.fdopen(fd, "wb") as tmp:
+                    for chunk in r.iter_content(chunk_size):
+                        size += len(chunk)
+                        if max_size is not None and size > max_size:
+                            raise TooLarge(
+                                url + " is over " + str(max_size) + " bytes")
+                        content_hash.update(chunk)
+                        tmp.write(chunk)
+                    tmp.flush()
+                    os.fsync(tmp.fileno())
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        return tmp_path, size, content_hash.hexdigest(), content_type
+
+    return retry(download, url, max_retry)
+
+
+def download_url(url: str, store: AssetStore, max_size: Optional[int] = None, feed: Optional[str] = None,
+                 slot=None):
+    """
+    Download the given url into the asset store, unless it's already there or being downloaded
+
+    :param str url: The url to download
+    :param AssetStore store: The store to save the downloaded files
+    :param int max_size: The maximum size in bytes, if not given, there is no limit
+    :param str feed: The feed referencing the url, recorded in the manifest
+    :param slot: A context manager held while downloading, like the host's semaphore
+
+    :return: (filename relative to the static dir, number of bytes downloaded, 0 if it was already there)
+    :raises TooLarge: If the file is larger than max_size, or was recently
+    :raises KnownFailure: If the url failed recently, see negative
+    :raises Exception: If failed to download
+
+    :description:
+        If another feed is downloading the same url right now, waits for it and
+        gets the same filename or the same exception.
+        Failures are recorded in the negative cache, so the url is skipped for a while.
+    """
+    filename = store.lookup(url, feed=feed)
+    if filename is not None:
+        print("File " + filename + " of " + url + " exists, skipping...")
+        metrics.count("asset_cache_hits")
+        return filename, 0
+    try:
+        negative.check(url)
+    except KnownFailure as e:
+        if e.state.get("reason") == TooLarge.failure_reason:
+            raise TooLarge(str(e)) from e
+        raise
+
+    def download():
+        with slot if slot is not None else contextlib.nullcontext():
+            print("Downloading " + url)
+            metrics.count("asset_cache_misses")
+            with metrics.span("download_asset"):
+                try:
+                    tmp_path, size, content_hash, content_type = repeat_download_to_temp(
+                        url, store.static_dir, max_size=max_size)
+                except Exception as e:
+                    negative.failure(url, e)
+                    raise
+            negative.success(url)
+            metrics.count("download_bytes", size, kind="asset")
+            return store.put(url, tmp_path, content_hash, size=size,
+                             content_type=content_type, feed=feed), size
+
+    (filename, size), shared = inflight.do(url, download)
+    if shared:
+        print("File " + filename + " of " + url + " was downloaded by another feed")
+        metrics.count("asset_inflight_shared")
+        store.lookup(url, feed=feed)
+        return filename, 0
+    return filename, size
+
+
+def download_all(urls, store: AssetStore, max_workers: int = 8, max_workers_per_host: int = 4,
+                 max_size: Optional[int] = None, keep_oversized_url: bool = True, feed: Optional[str] = None,
+                 optimizer: Optional[ImageOptimizer] = None):
+    """
+    Download all given urls in parallel, with a global and a per-host concurrency limit
+
+    :param list urls: The urls to download, duplicates are downloaded once
+    :param AssetStore store: The store to save the downloaded files
+    :param int max_workers: The maximum number of downloads running at the same time
+    :param int max_workers_per_host: The maximum number of downloads running at the same time against one host
+    :param int max_size: The maximum size in bytes of one file, if not given, there is no limit
+    :param bool keep_oversized_url: Keep the original url of files over max_size, otherwise they map to None
+    :param str feed: The feed referencing the urls, recorded in the manifest
+    :param ImageOptimizer optimizer: Optimize every downloaded image, and map its url to the variant if smaller
+
+    :return: (dict of url -> filename with failed urls left out, stats dict with assets, bytes, failed,
+             and retryable: the failures worth retrying soon, not permanent ones like 404)
+    :raises: None
+
+    :description:
+        Returns only after every download (and optimization) has either finished or failed.
+        Images are handed to the optimizer as soon as they are downloaded, the other downloads go on meanwhile.
+        The per-host limit is shared with other feeds downloading at the same time,
+        a host's limit is fixed by the first download from it.
+    """
+    def host_slot(url):
+        host = urlparse(url).netloc
+        with host_slots_lock:
+            if host not in host_slots:
+                host_slots[host] = threading.BoundedSemaphore(
+                    max_workers_per_host)
+            return host_slots[host]
+
+    def task(url):
+        return download_url(url, store, max_size=max_size, feed=feed, slot=host_slot(url))
+
+    result = {}
+    optimized = {}
+    stats = {"assets": 0, "bytes": 0, "failed": 0, "retryable": 0}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(run_in_context(task), url): url for url in dict.fromkeys(urls)}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                result[url], size = future.result()
+                if optimizer is not None:
+                    optimized[url] = optimizer.submit(result[url])
+                if size > 0:
+                    stats["assets"] += 1
+                    stats["bytes"] += size
+            except TooLarge as e:
+                print("Too large: " + str(e))
+                metrics.count("assets_skipped", reason="too_large")
+                if not keep_oversized_url:
+                    result[url] = None
+            except CircuitOpen as e:
+                print("Error: " + str(e))
+                metrics.count("assets_skipped", reason="circuit_open")
+                stats["failed"] += 1
+                stats["retryable"] += 1
+            except KnownFailure as e:
+                print("Skipped: " + str(e))
+                metrics.count("assets_skipped", reason="known_failure")
+                stats["failed"] += 1
+                if e.state["class"] != "permanent":
+                    stats["retryable"] += 1
+            except Exception as e:
+                print("Error: " + str(e))
+                metrics.count("assets_failed")
+                stats["failed"] += 1
+                if failure_class(e) != "permanent":
+                    stats["retryable"] += 1
+    for url, future in optimized.items():
         try:
-            request = urllib.request.Request(url, headers=headers)
-            with urllib.request.urlopen(request) as f:
-                data = f.read()
-            return data
+            result[url] = future.result()
         except Exception as e:
-            print("Error: " + str(e))
-            print("Retrying...")
-    raise Exception("Failed to download " + url + " after " + str(max_retry) + " retries")
+            print("Error: optimizing " + result[url] + ": " + str(e))
+    return result, stats
 
 
-def download_and_convert_url(original_xml: str, url: str, hosting_url: Optional[str], static_dir: str):
+def rewrite_urls(original_xml: str, filenames: dict, hosting_url: Optional[str]):
     """
-    Download the given url and convert it to a local url
+    Replace every downloaded url in the xml with its hosted url, in a single pass
+
+    Url-like runs are found with extract.url_matcher and replaced when they are one of the
+    raw forms (as is, or entity-escaped once or twice) of a downloaded url.
 
     :param str original_xml: The original xml string
-    :param str url: The url to convert
+    :param dict filenames: A dict of url -> filename (relative to static dir), urls mapped to None are removed
     :param str hosting_url: The URL of the website that hosts the feed, if not given, no links will be changed
-    :param str static_dir: The directory to save the downloaded files
 
     :return: The converted xml string
     :raises: None
     """
-    try:
-        filename = hashlib.sha256(url.encode("utf-8")).hexdigest()
-        filenamePath = os.path.join(static_dir, filename)
-
-        if os.path.exists(filenamePath):
-            print("File " + filenamePath + " exists, skipping...")
-        else:
-            print("Downloading " + url + " to " + filenamePath)
-            data = repeat_download(url)
-            with open(filenamePath, "wb") as f:
-                f.write(data)
-
-        # Convert url
-        if hosting_url is not None:
-            original_xml = original_xml.replace(
-                url, hosting_url + "/static/" + filename)
-        return original_xml
-    except Exception as e:
-        print("Error: " + str(e))
+    if hosting_url is None or len(filenames) == 0:
         return original_xml
 
+    replacements = {}
+    for url, filename in filenames.items():
+        new_url = "" if filename is None else hosting_url + "/static/" + filename
+        for old, new in zip(raw_forms(url), raw_forms(new_url)):
+            replacements.setdefault(old, new)
+
+    def replace(m):
+        url = m.group(0)
+        return replacements.get(url, url)
+
+    return url_matcher.sub(replace, original_xml)
 
-def backupRSSFeed(feedURL: str, output_dir: str, hosting_URL: str, xml_filename: Optional[str] = None):
+
+def backupRSSFeed(feedURL: str, output_dir: str, hosting_URL: str, xml_filename: Optional[str] = None,
+                  max_workers: int = 8, max_workers_per_host: int = 4,
+                  max_asset_size: Optional[int] = None, keep_oversized_url: bool = True,
+                  asset_store: Optional[AssetStore] = None, validator_store: Optional[ValidatorStore] = None,
+                  catalog: Optional[FeedCatalog] = None, minify: bool = False,
+                  image_optimizer: Optional[ImageOptimizer] = None,
+                  merge: bool = True, retention_count: Optional[int] = None, retention_days: Optional[int] = None):
     """
     Backup given RSS feed url and its contents to a folder
 
@@ -83,28 +403,59 @@ def backupRSSFeed(feedURL: str, output_dir: str, hosting_URL: str, xml_filename:
     :param str outputDir: The directory to output the results
     :param str hostingURL: The URL of the website that hosts the feed, if not given, no links will be changed
     :param str xmlFilename: The filename of the xml file, if not given, the feed name will be used
+    :param int max_workers: The maximum number of assets downloaded at the same time
+    :param int max_workers_per_host: The maximum number of assets downloaded at the same time from one host
+    :param int max_asset_size: The maximum size in bytes of one asset, if not given, there is no limit
+    :param bool keep_oversized_url: Keep the original url of assets over max_asset_size, otherwise the url is removed
+    :param AssetStore asset_store: The store shared between feeds, if not given, one is opened (and saved) for this feed
+    :param ValidatorStore validator_store: The validators shared between feeds, if not given, they are loaded for this feed
+    :param FeedCatalog catalog: The feed catalog shared between feeds, if not given, it is loaded for this feed
+    :param bool minify: Remove whitespace between tags from the saved xml
+    :param ImageOptimizer image_optimizer: If given, images are optimized and linked to the smaller variant
+    :param bool merge: Merge new entries into the backed up xml instead of overwriting it
+    :param int retention_count: When merging, keep at most this many entries, if not given, there is no limit
+    :param int retention_days: When merging, drop entries older than this many days, if not given, there is no limit
 
-    :return: None
-    :raises: None
+    :return: A dict with status (updated, not modified or unchanged),
+        bytes (downloaded), assets (added) and failed (assets)
+    :raises: Exception if the feed itself can't be downloaded
 
     :description:
         * outputDir folder structure
             ```txt
             outputDir/
                 static/
-                    example_image.png
+                    ab/cd/abcd... (sha256 of the content)
                 xml/
                     feed_name.xml (or xmlFilename.xml if xmlFilename is not None)
+                cache/
+                    validators.json
+                    assets.sqlite
+                    breakers.json
+                    catalog.json
+                    entries/
+                        feed_name.xml.json
                 feed_list.json
         ```
         * Notice on static folder
             No file get deleted, only added
-            Files are named: sha256(url), file extension is ignored
+            Files are named: ab/cd/sha256(content), file extension is ignored,
+            cache/assets.sqlite records url, content hash, bytes, content type, first/last seen and referencing feeds
+            Legacy files named sha256(url) are kept, and linked into the new layout by AssetStore.migrate_legacy
+            Files are written to a temporary file first and renamed into place once complete
+            With an ImageOptimizer, images also get a WebP/AVIF variant, linked to instead when smaller
+        * Notice on cache folder
+            cache/validators.json keeps ETag, Last-Modified and sha256 of every feed's last download,
+            a feed answering 304 or with an identical body is skipped entirely,
+            they aren't saved while an asset of the feed failed in a way worth retrying (5xx, timeout,
+            open circuit breaker), so the next run retries those; 4xx failures don't hold the feed back
+            They are dropped too when the feed's configured xmlFilename changed
+            cache/breakers.json keeps the circuit breaker of failing hosts between runs
         * Notice on xml folder
             If feed_name.xml already exists, it won't be simply overwritten
-            but instead, the new entries will be added to the front of the file
-            !! TODO: Increasement on RSS xml is bit difficult,
-            !! the current behaviour is overwritten than merged
+            but instead, the new entries will be added to the front of the file,
+            changed entries are updated, and entries gone upstream are kept until retention drops them
+            (see merge.merge_feed, cache/entries/ keeps the entry index of every feed)
     """
 
     print("Backing up " + feedURL)
@@ -114,22 +465,96 @@ def backupRSSFeed(feedURL: str, output_dir: str, hosting_URL: str, xml_filename:
         if not os.path.exists(dir):
             os.makedirs(dir)
 
+    validators = validator_store if validator_store is not None else ValidatorStore(
+        os.path.join(output_dir, "cache", "validators.json"))
+    validator = validators.get(feedURL)
+    # only trust the validators while the backed up xml is still there, under the configured name
+    if validator is not None and (not os.path.exists(os.path.join(xmlDir, validator["xmlFilename"])) or
+                                  (xml_filename is not None and xml_filename != validator["xmlFilename"])):
+        validator = None
+
     print("Downloading xml file...")
-    original_xml = repeat_download(feedURL, max_retry=10).decode("utf-8")
+    try:
+        with metrics.span("download_feed"):
+            data, response_headers = repeat_download(
+                feedURL, max_retry=10, return_headers=True,
+                extra_headers=validators.request_headers(feedURL) if validator is not None else None)
+    except NotModified:
+        print("Feed " + feedURL + " is not modified, skipping...")
+        metrics.count("feed_cache_hits", reason="not_modified")
+        return {"status": "not modified", "bytes": 0, "assets": 0, "failed": 0}
+    metrics.count("download_bytes", len(data), kind="feed")
+    sha256 = hashlib.sha256(data).hexdigest()
+    if validator is not None and validator["sha256"] == sha256:
+        print("Feed " + feedURL + " is unchanged, skipping...")
+        metrics.count("feed_cache_hits", reason="unchanged")
+        return {"status": "unchanged", "bytes": len(data), "assets": 0, "failed": 0}
+    metrics.count("feed_cache_misses")
+    original_xml = data.decode("utf-8")
     feedName = feedparser.parse(original_xml).feed.title
     if feedName == "":
         feedName = hashlib.sha256(feedURL.encode("utf-8")).hexdigest()
     feedXMLFilename = feedName + ".xml" if xml_filename is None else xml_filename
     feedPath = os.path.join(xmlDir, feedXMLFilename)
 
-    print("Downloaded xml file, replacing urls...")
-    for url in url_matcher.findall(original_xml):
-        original_xml = download_and_convert_url(
-            original_xml, url, hosting_URL, staticDir)
+    print("Downloaded xml file, downloading assets...")
+    store = asset_store if asset_store is not None else AssetStore(
+        staticDir, os.path.join(output_dir, "cache", "assets.sqlite"))
+    with metrics.span("download_assets"):
+        extracted = {}
+        urls = extract_urls(original_xml, stats=extracted)
+        for kind in ("img", "css", "link"):
+            metrics.count("asset_urls", sum(1 for k in urls.values() if k == kind), kind=kind)
+        metrics.count("page_links_skipped", extracted["skipped"])
+        filenames, stats = download_all(list(urls), store,
+                                        max_workers=max_workers,
+                                        max_workers_per_host=max_workers_per_host,
+                                        max_size=max_asset_size,
+                                        keep_oversized_url=keep_oversized_url,
+                                        feed=feedXMLFilename,
+                                        optimizer=image_optimizer)
+
+    if asset_store is None:
+        store.save()
+
+    print("Downloading assets done, replacing urls...")
+    with metrics.span("rewrite_urls"):
+        original_xml = rewrite_urls(original_xml, filenames, hosting_URL)
+
+    if merge:
+        print("Replacing urls done, merging xml file...")
+        with metrics.span("merge"):
+            original_xml, merged = merge_feed(original_xml, feedPath,
+                                              os.path.join(
+                                                  output_dir, "cache", "entries", feedXMLFilename + ".json"),
+                                              retention_count=retention_count,
+                                              retention_days=retention_days)
+        for k, v in merged.items():
+            metrics.count("entries_merged", v, result=k)
+        print("Merged: " + ", ".join(k + " " + str(v)
+              for k, v in merged.items()))
+    else:
+        print("Replacing urls done, saving xml file...")
 
-    print("Replacing urls done, saving xml file...")
-    if os.path.exists(feedPath):
-        os.remove(feedPath)
-    with open(feedPath, "w") as f:
-        f.write(original_xml)
+    written = False
+    if original_xml is not None:
+        with metrics.span("write_xml"):
+            if minify:
+                original_xml = minify_xml(original_xml)
+            written = writer.write(feedPath, original_xml)
+            if written:
+                (catalog if catalog is not None else FeedCatalog(output_dir)).update(
+                    feedXMLFilename, original_xml)
+            else:
+                print("Feed " + feedName + " didn't change, not rewriting it")
+    if stats["retryable"] > 0:
+        # an unchanged feed is skipped next run, keep it processed until its failed assets are backed up,
+        # permanent failures (like 404) won't succeed on a retry and don't hold the feed back
+        print(str(stats["retryable"]) + " assets of " + feedName + " failed and may be retried, "
+              "not saving its validators")
+        validators.forget(feedURL)
+    else:
+        validators.update(feedURL, response_headers, sha256, feedXMLFilename)
     print("Backup of " + feedName + " is done.")
+    return {"status": "updated" if written else "unchanged", "bytes": len(data) + stats["bytes"],
+            "assets": stats["assets"], "failed": stats["failed"]}
@@ -1 +1,5 @@
-from .RSS import backupRSSFeed
+from .RSS import backupRSSFeed, breaker, inflight, negative
+from .store import AssetStore
+from .validators import ValidatorStore
+from .images import ImageOptimizer
+from .warc import WARCWriter
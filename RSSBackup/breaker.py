@@ -0,0 +1,90 @@
+"""
+Per-host circuit breaker, so a host that is down isn't retried for every url on it.
+
+After `threshold` consecutive failures against a host, the breaker opens and every request
+to the host is refused for `cooldown` seconds. After the cool-down one request goes through,
+a success closes the breaker, a failure opens it again.
+
+State is kept between runs in outputDir/cache/breakers.json:
+```json
+{
+    "www.ustc.edu.cn": {"failures": 5, "openUntil": 1686729600.0}
+}
+```
+"""
+import threading
+import time
+from typing import Optional
+from Utils.output import load_state, save_state
+
+
+class CircuitOpen(Exception):
+    """
+    Raised instead of sending a request to a host whose breaker is open
+    """
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = 5, cooldown: float = 1800):
+        """
+        :param int threshold: Consecutive failures that open the breaker of a host
+        :param float cooldown: Seconds the breaker of a host stays open
+        """
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.path = None
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.skipped = 0
+
+    def load(self, path: str):
+        """
+        Load the breaker state saved by the last run, and save to the same path later
+        """
+        self.path = path
+        hosts = load_state(path, "breaker state")
+        if hosts is None:
+            return
+        with self.lock:
+            self.hosts = hosts
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            save_state(self.path, self.hosts)
+
+    def check(self, host: str):
+        """
+        Check the host may be requested
+
+        :param str host: The host
+
+        :raises CircuitOpen: If the breaker of the host is open
+        """
+        with self.lock:
+            state = self.hosts.get(host)
+            if state is not None and state.get("openUntil") is not None and time.time() < state["openUntil"]:
+                self.skipped += 1
+                raise CircuitOpen(host + " is failing, skipped until " + time.strftime(
+                    "%Y-%m-%d %H:%M:%S", time.localtime(state["openUntil"])))
+
+    def success(self, host: str):
+        with self.lock:
+            self.hosts.pop(host, None)
+
+    def failure(self, host: str) -> Optional[float]:
+        """
+        Record a failed request to the host
+
+        :return: The time the breaker stays open until, if this failure opened it
+        """
+        with self.lock:
+            state = self.hosts.setdefault(
+                host, {"failures": 0, "openUntil": None})
+            state["failures"] += 1
+            if state["failures"] >= self.threshold:
+                state["openUntil"] = time.time() + self.cooldown
+                return state["openUntil"]
+            return None
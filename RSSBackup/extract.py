@@ -0,0 +1,181 @@
+"""
+Markup-aware asset url extraction for feeds.
+
+The feed is read once with html.parser, which copes with RSS, Atom and broken markup alike.
+The html inside description / content:encoded / summary / content (entity-escaped or CDATA)
+is fed to a nested parser, so urls are taken from the attributes that actually load assets:
+
+```python
+extract_urls(xml)
+# {"https://example.com/a.jpg": "img", "https://example.com/s.css": "css", "https://example.com/f.pdf": "link"}
+```
+
+Kinds are img (images, posters, feed logos), css (stylesheets and url() in style attributes)
+and link (enclosures, media and <a href> to downloadable files). <a href> to pages is skipped.
+"""
+import html
+import os
+import re
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+
+# Elements whose text is html
+html_elements = {"description", "content:encoded", "summary", "content"}
+
+# <a href> is only downloaded when it points at one of these
+link_extensions = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif", ".svg", ".bmp",
+    ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".txt",
+    ".zip", ".rar", ".7z", ".gz", ".tar",
+    ".mp3", ".m4a", ".ogg", ".wav", ".mp4", ".webm", ".mov",
+}
+
+image_attributes = {"src", "data-src", "data-original", "data-lazy-src", "poster"}
+srcset_attributes = {"srcset", "data-srcset"}
+
+css_url_matcher = re.compile(r"""url\(\s*['"]?([^'")\s]+)['"]?\s*\)""")
+
+# Url-like runs in the raw xml, also inside entity-escaped html: stops at quotes and
+# at &quot; / &lt; / &gt; / &#39; / &apos;, but keeps &amp; (and &amp;amp;) inside query strings
+url_matcher = re.compile(
+    r"https?://(?:[^\s\"'<>()\\&]|&(?!quot;|#34;|#39;|apos;|lt;|gt;))+")
+
+
+def is_asset_url(url: str) -> bool:
+    return url.startswith("http://") or url.startswith("https://")
+
+
+def is_page_link(url: str) -> bool:
+    return os.path.splitext(urlparse(url).path)[1].lower() not in link_extensions
+
+
+def parse_srcset(srcset: str) -> list:
+    """
+    Get the urls of a srcset attribute, like "a.jpg 1x, b.jpg 2x"
+    """
+    result = []
+    for candidate in srcset.split(","):
+        parts = candidate.split()
+        if len(parts) > 0:
+            result.append(parts[0])
+    return result
+
+
+class URLExtractor(HTMLParser):
+    def __init__(self, urls: dict, stats: dict):
+        super().__init__(convert_charrefs=True)
+        self.urls = urls
+        self.stats = stats
+        self.html_element = None
+        self.html_text = []
+        self.in_image = False
+        self.image_url = []
+
+    def add(self, url: str, kind: str):
+        url = url.strip()
+        if not is_asset_url(url):
+            return
+        if kind == "link" and is_page_link(url):
+            self.stats["skipped"] += 1
+            return
+        self.urls.setdefault(url, kind)
+
+    def feed_html(self, text: str):
+        if "<" not in text:
+            return
+        parser = URLExtractor(self.urls, self.stats)
+        parser.feed(text)
+        parser.close()
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value for name, value in attrs if value is not None}
+        if tag in html_elements and attrs.get("type") != "xhtml":
+            self.html_element = tag
+            self.html_text = []
+            return
+        if tag == "image":
+            self.in_image = True
+        elif tag == "url" and self.in_image:
+            self.image_url = []
+
+        for name, value in attrs.items():
+            if name in image_attributes:
+                self.add(value, "img" if tag in ("img", "image", "source") or name == "poster" else "link")
+            elif name in srcset_attributes:
+                for url in parse_srcset(value):
+                    self.add(url, "img")
+            elif name == "style":
+                for url in css_url_matcher.findall(value):
+                    self.add(url, "css")
+
+        rel = attrs.get("rel", "").lower()
+        if tag == "link" and "href" in attrs:
+            if "stylesheet" in rel:
+                self.add(attrs["href"], "css")
+            elif "icon" in rel:
+                self.add(attrs["href"], "img")
+            elif rel == "enclosure":
+                self.add(attrs["href"], "link")
+        elif tag == "a" and "href" in attrs:
+            self.add(attrs["href"], "link")
+        elif tag in ("enclosure", "media:content", "media:thumbnail") and "url" in attrs:
+            image = tag == "media:thumbnail" or attrs.get("type", "").startswith("image/") or \
+                attrs.get("medium") == "image"
+            self.add(attrs["url"], "img" if image else "link")
+        elif tag == "itunes:image" and "href" in attrs:
+            self.add(attrs["href"], "img")
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag == self.html_element:
+            self.html_element = None
+
+    def handle_endtag(self, tag):
+        if tag == self.html_element:
+            self.html_element = None
+            self.feed_html("".join(self.html_text))
+        elif tag == "url" and self.in_image:
+            self.add("".join(self.image_url), "img")
+            self.image_url = []
+        elif tag == "image":
+            self.in_image = False
+
+    def handle_data(self, data):
+        if self.html_element is not None:
+            self.html_text.append(data)
+        elif self.in_image:
+            self.image_url.append(data)
+
+    def unknown_decl(self, data):
+        # <![CDATA[...]]>, html.parser hands over "CDATA[..."
+        if data.startswith("CDATA["):
+            self.handle_data(data[6:])
+
+
+def extract_urls(xml: str, stats: dict = None) -> dict:
+    """
+    Collect the asset urls of a feed, tagged by kind
+
+    :param str xml: The feed xml
+    :param dict stats: If given, stats["skipped"] is increased by the page links skipped
+
+    :return: A dict of url -> kind ("img", "css" or "link"), in document order
+    :rtype: dict
+    """
+    urls = {}
+    if stats is None:
+        stats = {}
+    stats.setdefault("skipped", 0)
+    parser = URLExtractor(urls, stats)
+    parser.feed(xml)
+    parser.close()
+    return urls
+
+
+def raw_forms(url: str) -> list:
+    """
+    The ways a url can be written in the raw xml: as is (CDATA), escaped once (attribute or
+    escaped html text) and escaped twice (an escaped attribute inside escaped html text)
+    """
+    once = html.escape(url, quote=False)
+    return [url, once, html.escape(once, quote=False)]
@@ -0,0 +1,179 @@
+"""
+Optional image optimization for backed up assets, needs the Pillow package.
+
+Downloaded images (detected by magic bytes) are transcoded to WebP (or AVIF, if Pillow supports it)
+and downscaled to at most max_dimension pixels on the long side, in a process pool.
+The variant is stored in the AssetStore like any other content, and used instead of the original
+only when it is smaller. Results are recorded in the manifest's variants table,
+and content being optimized is tracked by hash, so each content is optimized once,
+even when several urls of it are downloaded at the same time.
+"""
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+from .store import AssetStore
+from Utils.metrics import metrics
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+magic_bytes = [
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+]
+
+
+def detect_image(path: str) -> Optional[str]:
+    """
+    Detect the image type of a file by its magic bytes
+
+    :param str path: The file
+
+    :return: PNG, JPEG, GIF, BMP or WEBP, None if it isn't an image
+    """
+    with open(path, "rb") as f:
+        head = f.read(16)
+    if head[0:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for magic, kind in magic_bytes:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def transcode(src_path: str, tmp_dir: str, format: str, quality: int, max_dimension: int):
+    """
+    Transcode an image into a temporary file, runs in a worker process
+
+    :return: (temporary file path, size, sha256), or None if the image is skipped
+    """
+    with Image.open(src_path) as image:
+        # animations would lose every frame but the first
+        if getattr(image, "is_animated", False):
+            return None
+        image.thumbnail((max_dimension, max_dimension))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.mode in (
+                "LA", "PA") or "transparency" in image.info else "RGB")
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, format=format, quality=quality)
+    h = hashlib.sha256()
+    with open(tmp_path, "rb") as f:
+        h.update(f.read())
+    return tmp_path, os.path.getsize(tmp_path), h.hexdigest()
+
+
+class ImageOptimizer:
+    def __init__(self, store: AssetStore, format: str = "WEBP", quality: int = 80,
+                 max_dimension: int = 1280, workers: int = 2):
+        """
+        :param AssetStore store: The store the originals are in, variants are stored there too
+        :param str format: WEBP or AVIF
+        :param int quality: The encoder quality, 0-100
+        :param int max_dimension: The maximum width and height of a variant
+        :param int workers: The number of worker processes
+        """
+        if Image is None:
+            raise ImportError("Pillow is needed to optimize images")
+        self.store = store
+        self.format = format
+        self.quality = quality
+        self.max_dimension = max_dimension
+        # workers are started lazily from download threads, forking then could copy a lock another thread holds
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method))
+        self.lock = threading.Lock()
+        # content hash -> future of the optimization running for it
+        self.pending = {}
+        self.stats = {"images": 0, "optimized": 0,
+                      "original_bytes": 0, "optimized_bytes": 0}
+
+    def submit(self, filename: str) -> Future:
+        """
+        Start optimizing a stored file, in the background
+
+        :param str filename: The filename of the original, relative to the static dir
+
+        :return: A future of the filename to link to, the variant if it's smaller, otherwise filename;
+                 it raises the error if optimizing failed, for the caller to report and keep filename
+        """
+        content_hash = os.path.basename(filename)
+        path = os.path.join(self.store.static_dir, filename)
+        with self.lock:
+            if content_hash in self.pending:
+                return self.pending[content_hash]
+            variant = self.store.manifest.get_variant(content_hash)
+            if variant is not None:
+                result = Future()
+                result.set_result(
+                    variant["filename"] if variant["filename"] is not None else filename)
+                return result
+            if detect_image(path) not in ("PNG", "JPEG", "BMP"):
+                result = Future()
+                result.set_result(filename)
+                return result
+            result = Future()
+            self.pending[content_hash] = result
+
+        future = self.pool.submit(transcode, path, self.store.static_dir,
+                                  self.format, self.quality, self.max_dimension)
+
+        def done(future):
+            try:
+                result.set_result(self.finish(
+                    filename, content_hash, os.path.getsize(path), future.result()))
+            except Exception as e:
+                # runs in the executor's thread, outside the feed's log group, the caller reports it
+                result.set_exception(e)
+            with self.lock:
+                self.pending.pop(content_hash, None)
+
+        future.add_done_callback(done)
+        return result
+
+    def finish(self, filename: str, content_hash: str, original_bytes: int, transcoded) -> str:
+        manifest = self.store.manifest
+        with self.lock:
+            self.stats["images"] += 1
+            self.stats["original_bytes"] += original_bytes
+        metrics.count("image_bytes", original_bytes, kind="original")
+        if transcoded is None:
+            manifest.record_variant(
+                content_hash, None, None, original_bytes, None, None)
+            with self.lock:
+                self.stats["optimized_bytes"] += original_bytes
+            metrics.count("image_bytes", original_bytes, kind="optimized")
+            return filename
+
+        tmp_path, size, variant_hash = transcoded
+        if size >= original_bytes:
+            os.remove(tmp_path)
+            manifest.record_variant(
+                content_hash, None, None, original_bytes, size, self.format)
+            with self.lock:
+                self.stats["optimized_bytes"] += original_bytes
+            metrics.count("image_bytes", original_bytes, kind="optimized")
+            return filename
+
+        variant_filename = self.store.store_file(tmp_path, variant_hash)
+        manifest.record_variant(content_hash, variant_hash, variant_filename,
+                                original_bytes, size, self.format)
+        with self.lock:
+            self.stats["optimized"] += 1
+            self.stats["optimized_bytes"] += size
+        metrics.count("image_bytes", size, kind="optimized")
+        metrics.count("images_optimized")
+        return variant_filename
+
+    def close(self):
+        self.pool.shutdown()
@@ -0,0 +1,208 @@
+"""
+SQLite manifest of every backed up static asset, saved to outputDir/cache/assets.sqlite
+
+```sql
+assets(url_hash, url, content_hash, filename, bytes, content_type, first_seen, last_seen)
+asset_feeds(url_hash, feed)
+variants(content_hash, variant_hash, filename, original_bytes, variant_bytes, format)
+meta(key, value)
+```
+
+url_hash is sha256(url), url is NULL for legacy files migrated before their url was seen again.
+variants holds the optimized image made from a content hash, variant_hash is NULL if optimizing didn't help.
+meta holds flags of the store itself, like legacyMigrated once AssetStore.migrate_legacy has run.
+Updates are buffered in memory and written in one transaction by flush().
+
+The manifest lives in outputDir/cache, so it is committed to gh-pages with the feeds, as the workflow
+keeps no other state between runs. Being binary, every change commits a new copy of it, so seeing an
+asset again only changes it once a day (last_seen has day granularity) or when a feed references it
+for the first time; a run where nothing new was stored or seen leaves the file untouched.
+"""
+import datetime
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+schema = """
+CREATE TABLE IF NOT EXISTS assets (
+    url_hash TEXT PRIMARY KEY,
+    url TEXT,
+    content_hash TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    bytes INTEGER,
+    content_type TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS asset_feeds (
+    url_hash TEXT NOT NULL,
+    feed TEXT NOT NULL,
+    PRIMARY KEY (url_hash, feed)
+);
+CREATE INDEX IF NOT EXISTS assets_content_hash ON assets (content_hash);
+CREATE TABLE IF NOT EXISTS variants (
+    content_hash TEXT PRIMARY KEY,
+    variant_hash TEXT,
+    filename TEXT,
+    original_bytes INTEGER,
+    variant_bytes INTEGER,
+    format TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+columns = ["url_hash", "url", "content_hash", "filename",
+           "bytes", "content_type", "first_seen", "last_seen"]
+variant_columns = ["content_hash", "variant_hash", "filename",
+                   "original_bytes", "variant_bytes", "format"]
+
+
+def now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+class AssetManifest:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.pending = {}
+        self.pending_feeds = set()
+        self.pending_variants = {}
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(schema)
+
+    def get(self, url_hash: str) -> Optional[dict]:
+        """
+        Get the manifest row of the given url hash, including updates not flushed yet
+
+        :param str url_hash: sha256(url)
+
+        :return: A dict of the row's columns, or None if the url is unknown
+        """
+        with self.lock:
+            if url_hash in self.pending:
+                return dict(self.pending[url_hash])
+            row = self.connection.execute(
+                "SELECT " + ", ".join(columns) + " FROM assets WHERE url_hash = ?", (url_hash,)).fetchone()
+        return None if row is None else dict(zip(columns, row))
+
+    def record(self, url_hash: str, url: Optional[str], content_hash: str, filename: str,
+               size: Optional[int] = None, content_type: Optional[str] = None, feed: Optional[str] = None):
+        """
+        Record a stored asset, buffered until flush()
+
+        :param str url_hash: sha256(url)
+        :param str url: The url of the asset, None if unknown
+        :param str content_hash: sha256 of the content
+        :param str filename: The filename relative to the static dir
+        :param int size: The size in bytes, None if unknown
+        :param str content_type: The Content-Type of the response, None if unknown
+        :param str feed: The feed referencing the asset, if any
+        """
+        with self.lock:
+            previous = self.get(url_hash)
+            timestamp = now()
+            row = previous if previous is not None else {
+                "url_hash": url_hash, "first_seen": timestamp}
+            row.update({
+                "url": url if url is not None else row.get("url"),
+                "content_hash": content_hash,
+                "filename": filename,
+                "bytes": size if size is not None else row.get("bytes"),
+                "content_type": content_type if content_type is not None else row.get("content_type"),
+                "last_seen": timestamp
+            })
+            self.pending[url_hash] = row
+            if feed is not None:
+                self.pending_feeds.add((url_hash, feed))
+
+    def touch(self, url_hash: str, url: str, feed: Optional[str] = None):
+        """
+        Mark an already stored asset as seen again, buffered until flush()
+
+        last_seen is only moved when the day changed, and the feed only added if it is new,
+        so seeing the same assets again the same day changes nothing
+        """
+        with self.lock:
+            row = self.get(url_hash)
+            if row is None:
+                return
+            if row["last_seen"][:10] != now()[:10] or (url is not None and row["url"] != url):
+                self.record(url_hash, url, row["content_hash"], row["filename"])
+            if feed is not None and not self.has_feed(url_hash, feed):
+                self.pending_feeds.add((url_hash, feed))
+
+    def has_feed(self, url_hash: str, feed: str) -> bool:
+        with self.lock:
+            if (url_hash, feed) in self.pending_feeds:
+                return True
+            return self.connection.execute(
+                "SELECT 1 FROM asset_feeds WHERE url_hash = ? AND feed = ?", (url_hash, feed)).fetchone() is not None
+
+    def get_variant(self, content_hash: str) -> Optional[dict]:
+        """
+        Get the optimized variant recorded for a content hash, including updates not flushed yet
+
+        :return: A dict of the variants row, or None if the content was never optimized
+        """
+        with self.lock:
+            if content_hash in self.pending_variants:
+                return dict(self.pending_variants[content_hash])
+            row = self.connection.execute(
+                "SELECT " + ", ".join(variant_columns) + " FROM variants WHERE content_hash = ?", (content_hash,)).fetchone()
+        return None if row is None else dict(zip(variant_columns, row))
+
+    def record_variant(self, content_hash: str, variant_hash: Optional[str], filename: Optional[str],
+                       original_bytes: int, variant_bytes: Optional[int], format: Optional[str]):
+        """
+        Record the optimized variant of a content hash, buffered until flush()
+        """
+        with self.lock:
+            self.pending_variants[content_hash] = dict(zip(variant_columns, [
+                content_hash, variant_hash, filename, original_bytes, variant_bytes, format]))
+
+    def flush(self):
+        """
+        Write every buffered update in one transaction
+        """
+        with self.lock:
+            if len(self.pending) == 0 and len(self.pending_feeds) == 0 and len(self.pending_variants) == 0:
+                return
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO assets (" + ", ".join(columns) + ") VALUES (" +
+                    ", ".join("?" * len(columns)) + ")",
+                    [tuple(row[c] for c in columns) for row in self.pending.values()])
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO asset_feeds (url_hash, feed) VALUES (?, ?)",
+                    list(self.pending_feeds))
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO variants (" + ", ".join(variant_columns) + ") VALUES (" +
+                    ", ".join("?" * len(variant_columns)) + ")",
+                    [tuple(row[c] for c in variant_columns) for row in self.pending_variants.values()])
+            self.pending = {}
+            self.pending_feeds = set()
+            self.pending_variants = {}
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key: str, value: str):
+        """
+        Set a flag of the store, written at once
+        """
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,112 @@
+"""
+Incremental merge of a freshly downloaded feed into the backed up one.
+
+Feeds like WeRSS only expose the last N articles, merging keeps older entries in the backup.
+Entries are handled as raw text fragments (<item>...</item> or <entry>...</entry>),
+so unchanged entries are copied verbatim and never re-parsed or re-serialized.
+
+Every backed up feed has an entry index in outputDir/cache/entries/<xmlFilename>.json,
+in the same order as the entries in the xml:
+```json
+[
+    {"key": "https://mp.weixin.qq.com/s/abc", "sha256": "9f86d0...", "date": "2023-06-14T08:00:00+00:00"}
+]
+```
+"""
+import datetime
+import hashlib
+import os
+from typing import Optional
+from Utils.feedxml import split_entries, entry_key, entry_date
+from Utils.output import load_state, save_state
+
+def describe(entry: str) -> dict:
+    date = entry_date(entry)
+    return {
+        "key": entry_key(entry),
+        "sha256": hashlib.sha256(entry.encode("utf-8")).hexdigest(),
+        "date": None if date is None else date.isoformat()
+    }
+
+
+def load_index(path: str) -> Optional[list]:
+    return load_state(path, "entry index")
+
+
+def save_index(path: str, index: list):
+    save_state(path, index)
+
+
+def merge_feed(new_xml: str, feed_path: str, index_path: str,
+               retention_count: Optional[int] = None, retention_days: Optional[int] = None):
+    """
+    Merge new_xml into the feed backed up at feed_path
+
+    :param str new_xml: The freshly downloaded (and url rewritten) feed
+    :param str feed_path: The backed up feed, may not exist
+    :param str index_path: The entry index of the backed up feed, may not exist
+    :param int retention_count: Keep at most this many entries, if not given, there is no limit
+    :param int retention_days: Drop entries older than this many days, if not given, there is no limit
+
+    :return: (merged xml, or None if nothing changed; stats dict with added, updated, kept, dropped)
+    :raises: None
+
+    :description:
+        The channel header comes from new_xml. New entries go to the front, in upstream order,
+        entries changed upstream are replaced, entries gone upstream are kept (as they were)
+        behind the upstream ones, until the retention limits drop them.
+    """
+    head, new_entries, tail = split_entries(new_xml)
+    new_index = [describe(entry) for entry in new_entries]
+    old_index = load_index(index_path)
+    stats = {"added": 0, "updated": 0, "kept": 0, "dropped": 0}
+
+    if old_index is None or not os.path.exists(feed_path):
+        stats["added"] = len(new_entries)
+        save_index(index_path, new_index)
+        return new_xml, stats
+    if len(new_entries) == 0:
+        # an empty (or not a feed at all) upstream answer must not wipe the history kept so far
+        print("Upstream has no entries, keeping the backup as it is")
+        return None, stats
+
+    old_by_key = {item["key"]: item for item in old_index}
+    new_keys = set(item["key"] for item in new_index)
+    for item in new_index:
+        if item["key"] not in old_by_key:
+            stats["added"] += 1
+        elif old_by_key[item["key"]]["sha256"] != item["sha256"]:
+            stats["updated"] += 1
+
+    if stats["added"] == 0 and stats["updated"] == 0 and \
+            [item["key"] for item in old_index[:len(new_index)]] == [item["key"] for item in new_index]:
+        return None, stats
+
+    with open(feed_path, "r") as f:
+        _, old_entries, _ = split_entries(f.read())
+    if len(old_entries) != len(old_index):
+        # the backed up xml doesn't match its index, start over from upstream
+        stats["added"] = len(new_entries)
+        save_index(index_path, new_index)
+        return new_xml, stats
+
+    entries = list(zip(new_entries, new_index))
+    for entry, item in zip(old_entries, old_index):
+        if item["key"] not in new_keys:
+            entries.append((entry, item))
+            stats["kept"] += 1
+
+    if retention_days is not None:
+        cutoff = datetime.datetime.now(
+            datetime.timezone.utc) - datetime.timedelta(days=retention_days)
+        kept = [(entry, item) for entry, item in entries
+                if item["key"] in new_keys or item["date"] is None or
+                datetime.datetime.fromisoformat(item["date"]) >= cutoff]
+        stats["dropped"] += len(entries) - len(kept)
+        entries = kept
+    if retention_count is not None and len(entries) > retention_count:
+        stats["dropped"] += len(entries) - retention_count
+        entries = entries[:retention_count]
+
+    save_index(index_path, [item for _, item in entries])
+    return head + "\n".join(entry for entry, _ in entries) + tail, stats
@@ -0,0 +1,136 @@
+"""
+Negative cache for asset urls that keep failing, so dead images aren't retried every run.
+
+Failures are permanent (4xx, like a deleted image) or transient (5xx, 429, timeouts, connection errors).
+Other errors may declare their class and a reason in failure_class / failure_reason attributes,
+like RSS.TooLarge (permanent, "too_large") for assets over the size cap.
+A failed url is skipped for a TTL that starts at the class' base TTL and doubles with every
+further failure, up to max_ttl. A success forgets the url.
+
+State is kept between runs in outputDir/cache/negative.json:
+```json
+{
+    "https://mmbiz.qpic.cn/.../640?wx_fmt=png": {"class": "permanent", "status": 404, "failures": 2, "until": 1686729600.0},
+    "https://example.com/video.mp4": {"class": "permanent", "status": null, "reason": "too_large", "failures": 1, "until": 1686729600.0}
+}
+```
+"""
+import threading
+import time
+from typing import Optional
+from Utils.output import load_state, save_state
+
+import requests
+
+
+class KnownFailure(Exception):
+    """
+    Raised instead of downloading a url that failed recently, state is its negative cache entry
+    """
+    def __init__(self, message: str, state: dict):
+        super().__init__(message)
+        self.state = state
+
+
+def failure_class(e: BaseException) -> Optional[str]:
+    """
+    Classify a download error, looking through the errors it was raised from
+
+    :return: "permanent", "transient", or None if it isn't a failure of the url itself
+    """
+    while e is not None:
+        if getattr(e, "failure_class", None) is not None:
+            return e.failure_class
+        if isinstance(e, requests.HTTPError) and e.response is not None:
+            status = e.response.status_code
+            if 400 <= status < 500 and status not in (408, 429):
+                return "permanent"
+            return "transient"
+        if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+            return "transient"
+        e = e.__cause__
+    return None
+
+
+def failure_status(e: BaseException) -> Optional[int]:
+    while e is not None:
+        if isinstance(e, requests.HTTPError) and e.response is not None:
+            return e.response.status_code
+        e = e.__cause__
+    return None
+
+
+class NegativeCache:
+    def __init__(self, permanent_ttl: float = 86400, transient_ttl: float = 600, max_ttl: float = 30 * 86400):
+        """
+        :param float permanent_ttl: Seconds a url is skipped after its first permanent failure
+        :param float transient_ttl: Seconds a url is skipped after its first transient failure
+        :param float max_ttl: The longest a url is skipped
+        """
+        self.ttl = {"permanent": permanent_ttl, "transient": transient_ttl}
+        self.max_ttl = max_ttl
+        self.path = None
+        self.lock = threading.Lock()
+        self.urls = {}
+        # Number of downloads skipped because the url is known to fail
+        self.saved = 0
+
+    def load(self, path: str):
+        """
+        Load the failures saved by the last run, and save to the same path later
+        """
+        self.path = path
+        urls = load_state(path, "negative cache")
+        if urls is None:
+            return
+        now = time.time()
+        with self.lock:
+            # Expired entries are kept, their failure count makes the next TTL longer
+            self.urls = {url: state for url, state in urls.items()
+                         if now < state["until"] + self.max_ttl}
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            save_state(self.path, self.urls)
+
+    def check(self, url: str):
+        """
+        Check the url may be downloaded
+
+        :param str url: The url
+
+        :raises KnownFailure: If the url failed recently
+        """
+        with self.lock:
+            state = self.urls.get(url)
+            if state is not None and time.time() < state["until"]:
+                self.saved += 1
+                raise KnownFailure(url + " failed " + str(state["failures"]) + " times (" + (
+                    str(state["status"]) if state.get("status") is not None else state.get("reason", state["class"])) +
+                    "), skipped until " + time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(state["until"])),
+                    dict(state))
+
+    def success(self, url: str):
+        with self.lock:
+            self.urls.pop(url, None)
+
+    def failure(self, url: str, e: BaseException) -> Optional[float]:
+        """
+        Record a failed download of the url
+
+        :return: The time the url is skipped until, None if the error isn't a failure of the url
+        """
+        kind = failure_class(e)
+        if kind is None:
+            return None
+        with self.lock:
+            state = self.urls.get(url)
+            failures = 1 if state is None else state["failures"] + 1
+            ttl = min(self.ttl[kind] * 2 ** (failures - 1), self.max_ttl)
+            self.urls[url] = {"class": kind, "status": failure_status(e),
+                              "failures": failures, "until": time.time() + ttl}
+            if getattr(e, "failure_reason", None) is not None:
+                self.urls[url]["reason"] = e.failure_reason
+            return self.urls[url]["until"]
@@ -0,0 +1,45 @@
+"""
+Single-flight: concurrent calls for the same key share one execution.
+
+Feeds backed up at the same time often embed the same images (logos, banners),
+the first feed to ask for a url downloads it, the others wait for its result.
+"""
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        # Number of calls that were answered by another caller's execution
+        self.shared = 0
+
+    def do(self, key, func):
+        """
+        Run func, unless a call for key is already running, then wait for that call instead
+
+        :param key: The key telling calls apart, like the url
+        :param func: The function to run, without arguments
+
+        :return: (the result of func, True if it came from another caller's call)
+        :raises Exception: Whatever func raised, every waiting caller gets the same exception
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return call.result(), True
+
+        try:
+            call.set_result(func())
+        except BaseException as e:
+            call.set_exception(e)
+        finally:
+            with self.lock:
+                del self.calls[key]
+        return call.result(), False
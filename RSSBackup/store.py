@@ -0,0 +1,141 @@
+"""
+Content-addressed static asset store.
+
+Assets are named by the sha256 of their content and sharded into two directory levels,
+so the same file served under two urls is stored once:
+```txt
+static/
+    9f/86/9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08
+    6c7b30a823d4...   (legacy, named sha256(url), see migrate_legacy)
+```
+
+Which url maps to which content is kept in the AssetManifest (outputDir/cache/assets.sqlite),
+lookups go through the manifest and never touch the filesystem.
+"""
+import hashlib
+import os
+import re
+import shutil
+from typing import Optional
+from .manifest import AssetManifest, now
+
+legacy_matcher = re.compile(r"^[0-9a-f]{64}$")
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class AssetStore:
+    def __init__(self, static_dir: str, manifest_path: str):
+        self.static_dir = static_dir
+        self.manifest = AssetManifest(manifest_path)
+
+    @staticmethod
+    def content_filename(content_hash: str) -> str:
+        """
+        The filename (relative to static_dir) of the given content hash, like ab/cd/abcd...
+        """
+        return content_hash[0:2] + "/" + content_hash[2:4] + "/" + content_hash
+
+    def lookup(self, url: str, feed: Optional[str] = None) -> Optional[str]:
+        """
+        Find the stored file of the given url, and mark it as seen
+
+        :param str url: The url of the asset
+        :param str feed: The feed referencing the asset, if any
+
+        :return: The filename (relative to static_dir), or None if the url isn't stored
+        """
+        key = url_hash(url)
+        row = self.manifest.get(key)
+        if row is None:
+            return None
+        self.manifest.touch(key, url, feed=feed)
+        return row["filename"]
+
+    def put(self, url: str, path: str, content_hash: str, size: Optional[int] = None,
+            content_type: Optional[str] = None, feed: Optional[str] = None) -> str:
+        """
+        Move the complete file at path into the store as the content of url
+
+        :param str url: The url of the asset
+        :param str path: The complete file to store
+        :param str content_hash: The sha256 of the file's content
+        :param int size: The size in bytes
+        :param str content_type: The Content-Type of the response
+        :param str feed: The feed referencing the asset, if any
+
+        :return: The filename (relative to static_dir)
+        """
+        filename = self._store(path, content_hash, keep_source=False)
+        self.manifest.record(url_hash(url), url, content_hash, filename,
+                             size=size, content_type=content_type, feed=feed)
+        return filename
+
+    def store_file(self, path: str, content_hash: str) -> str:
+        """
+        Move the complete file at path into the store, without a url (like an optimized variant)
+
+        :return: The filename (relative to static_dir)
+        """
+        return self._store(path, content_hash, keep_source=False)
+
+    def _store(self, path: str, content_hash: str, keep_source: bool) -> str:
+        filename = self.content_filename(content_hash)
+        target = os.path.join(self.static_dir, filename)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target):
+            if not keep_source:
+                os.remove(path)
+        elif keep_source:
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copyfile(path, target)
+        else:
+            os.replace(path, target)
+        return filename
+
+    def migrate_legacy(self) -> int:
+        """
+        Link every legacy static/sha256(url) file into the content-addressed layout, once
+
+        The legacy file is kept in place (as a hard link, so no space is used),
+        so /static/sha256(url) links that were already published keep resolving.
+        Nothing new is ever stored under a legacy name, so once done, the manifest records it
+        and later runs don't list static/ again.
+
+        :return: The number of migrated files, 0 if the migration was already done
+        """
+        if self.manifest.get_meta("legacyMigrated") is not None:
+            return 0
+        count = 0
+        for name in os.listdir(self.static_dir):
+            if not legacy_matcher.match(name) or self.manifest.get(name) is not None:
+                continue
+            path = os.path.join(self.static_dir, name)
+            if not os.path.isfile(path):
+                continue
+            content_hash = file_hash(path)
+            filename = self._store(path, content_hash, keep_source=True)
+            self.manifest.record(name, None, content_hash, filename,
+                                 size=os.path.getsize(path))
+            count += 1
+        self.manifest.flush()
+        self.manifest.set_meta("legacyMigrated", now())
+        return count
+
+    def save(self):
+        """
+        Write the buffered manifest updates to disk
+        """
+        self.manifest.flush()
@@ -0,0 +1,95 @@
+"""
+Persisted HTTP validators (ETag, Last-Modified) and body hashes of feed xml downloads,
+used to skip feeds that haven't changed since the last run.
+
+Saved to outputDir/cache/validators.json, looks like this:
+```json
+{
+    "https://cdn.werss.weapp.design/api/v1/feeds/fd85a6cc-1073-4d7f-872b-d662c08761cd.xml": {
+        "etag": "\"64a1f3c2-1b2e\"",
+        "lastModified": "Sun, 02 Jul 2023 08:00:00 GMT",
+        "sha256": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08",
+        "xmlFilename": "mp_ustc_main.xml"
+    }
+}
+```
+"""
+import threading
+from typing import Optional
+from Utils.output import load_state, save_state
+
+
+class ValidatorStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.validators = load_state(path, "validator store", {})
+
+    def get(self, url: str) -> Optional[dict]:
+        """
+        Get the validators saved for the given url
+
+        :param str url: The feed url
+
+        :return: The saved validators, or None if the url was never saved
+        """
+        with self.lock:
+            return self.validators.get(url)
+
+    def request_headers(self, url: str) -> dict:
+        """
+        Make the conditional request headers for the given url
+
+        :param str url: The feed url
+
+        :return: A dict with If-None-Match / If-Modified-Since, empty if nothing is saved
+        """
+        validator = self.get(url)
+        if validator is None:
+            return {}
+        result = {}
+        if validator.get("etag"):
+            result["If-None-Match"] = validator["etag"]
+        if validator.get("lastModified"):
+            result["If-Modified-Since"] = validator["lastModified"]
+        return result
+
+    def forget(self, url: str):
+        """
+        Drop the validators of the given url and write the store to disk,
+        so the next run downloads and processes the feed again
+
+        :param str url: The feed url
+
+        :return: None
+        """
+        with self.lock:
+            if self.validators.pop(url, None) is None:
+                return
+            self.save()
+
+    def update(self, url: str, response_headers, sha256: str, xml_filename: str):
+        """
+        Save the validators of a successful download and write the store to disk
+
+        :param str url: The feed url
+        :param response_headers: The response headers of the download
+        :param str sha256: The sha256 of the downloaded body
+        :param str xml_filename: The filename the feed is saved as, inside outputDir/xml/
+
+        :return: None
+        """
+        with self.lock:
+            self.validators[url] = {
+                "etag": response_headers.get("ETag"),
+                "lastModified": response_headers.get("Last-Modified"),
+                "sha256": sha256,
+                "xmlFilename": xml_filename
+            }
+            self.save()
+
+    def save(self):
+        """
+        Write the store to disk, called with the lock held
+        """
+        save_state(self.path, self.validators)
@@ -0,0 +1,260 @@
+"""
+Append-only WARC archive of fetched pages, with a CDX index for random access.
+
+Every fetch is recorded as a request / response record pair (WARC 1.1), each record its own gzip member,
+into segments named <prefix>-<period>-<n>.warc.gz. A new segment is started when the period
+(by default the month) changes or the segment grows over max_segment_size, so a period is one
+large sequential file instead of thousands of small ones, readable by standard WARC tools.
+
+index.cdx next to the segments has one CDX line per response (" CDX N b a m s k r M S V g"):
+```
+cn,edu,ustc,tj)/2023/0614/c30734a605933/page.htm 20230614080000 http://www.tj.ustc.edu.cn/2023/0614/c30734a605933/page.htm text/html 200 Q2N6... - - 2481 0 articles-202306-00000.warc.gz
+```
+so a record is read back with one seek, see lookup and read_record.
+
+Response bodies are stored as requests decoded them, Content-Encoding / Transfer-Encoding are
+dropped from the recorded headers and Content-Length is set to the stored body.
+"""
+import base64
+import datetime
+import glob
+import gzip
+import hashlib
+import os
+import threading
+import uuid
+from typing import Optional
+from urllib.parse import urlsplit
+
+software = "LU_RSS"
+dropped_headers = {"content-encoding", "transfer-encoding", "content-length"}
+
+
+def digest(data: bytes) -> str:
+    return "sha1:" + base64.b32encode(hashlib.sha1(data).digest()).decode("ascii")
+
+
+def surt(url: str) -> str:
+    """
+    The SURT form of a url used as CDX key, like cn,edu,ustc,tj)/tzgg/list.htm
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if not host.replace(".", "").isdigit():
+        host = ",".join(reversed(host.split(".")))
+    key = host + ")" + (parts.path or "/")
+    if parts.query:
+        key += "?" + parts.query
+    return key.lower()
+
+
+def http_version(response) -> str:
+    version = getattr(response.raw, "version", 11)
+    return "HTTP/1.0" if version == 10 else "HTTP/1.1"
+
+
+def request_block(response) -> bytes:
+    request = response.request
+    parts = urlsplit(request.url)
+    target = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+    lines = [f"{request.method} {target} {http_version(response)}", "Host: " + parts.netloc]
+    lines += [f"{name}: {value}" for name, value in request.headers.items() if name.lower() != "host"]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+
+def response_block(response, body: bytes) -> bytes:
+    lines = [f"{http_version(response)} {response.status_code} {response.reason}"]
+    lines += [f"{name}: {value}" for name, value in response.raw.headers.items()
+              if name.lower() not in dropped_headers]
+    lines.append("Content-Length: " + str(len(body)))
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + body
+
+
+def record(warc_type: str, block: bytes, headers: dict) -> bytes:
+    fields = {
+        "WARC-Type": warc_type,
+        "WARC-Record-ID": headers.pop("WARC-Record-ID", "<urn:uuid:" + str(uuid.uuid4()) + ">"),
+        **headers,
+        "WARC-Block-Digest": digest(block),
+        "Content-Length": str(len(block)),
+    }
+    head = "WARC/1.1\r\n" + "".join(f"{name}: {value}\r\n" for name, value in fields.items()) + "\r\n"
+    return head.encode("utf-8") + block + b"\r\n\r\n"
+
+
+class WARCWriter:
+    def __init__(self, directory: str, prefix: str = "archive", max_segment_size: int = 100 * 1024 * 1024,
+                 period: str = "%Y%m"):
+        """
+        :param str directory: The directory of the segments and index.cdx
+        :param str prefix: The segment name prefix
+        :param int max_segment_size: Start a new segment once the current one is this many bytes
+        :param str period: strftime format of the period in segment names, a new period starts a new segment
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.max_segment_size = max_segment_size
+        self.period = period
+        self.lock = threading.Lock()
+        self.segment = None
+        self.segment_period = None
+        self.index_lines = []
+        self.records = 0
+
+    def segment_path(self, period: str, number: int) -> str:
+        return os.path.join(self.directory, f"{self.prefix}-{period}-{number:05d}.warc.gz")
+
+    def open_segment(self, now: datetime.datetime):
+        """
+        Pick the segment to append to: the last one of the current period, or a new one if it is full
+        """
+        period = now.strftime(self.period)
+        if self.segment is not None and self.segment_period == period and \
+                os.path.getsize(self.segment) < self.max_segment_size:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        existing = sorted(glob.glob(os.path.join(glob.escape(self.directory),
+                                                 glob.escape(f"{self.prefix}-{period}-") + "*.warc.gz")))
+        number = 0
+        if len(existing) > 0:
+            last = existing[-1]
+            number = int(last[-len("00000.warc.gz"):-len(".warc.gz")])
+            if os.path.getsize(last) >= self.max_segment_size:
+                number += 1
+        self.segment = self.segment_path(period, number)
+        self.segment_period = period
+        if not os.path.exists(self.segment) or os.path.getsize(self.segment) == 0:
+            block = f"software: {software}\r\nformat: WARC File Format 1.1\r\n".encode("utf-8")
+            self.append(record("warcinfo", block, {
+                "WARC-Date": now.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "WARC-Filename": os.path.basename(self.segment),
+                "Content-Type": "application/warc-fields",
+            }))
+
+    def append(self, data: bytes) -> tuple:
+        """
+        Append one record as its own gzip member
+
+        :return: (offset, compressed length)
+        """
+        compressed = gzip.compress(data, 9, mtime=0)
+        with open(self.segment, "ab") as f:
+            offset = f.tell()
+            f.write(compressed)
+        return offset, len(compressed)
+
+    def write_response(self, response, body: Optional[bytes] = None):
+        """
+        Record a requests response and the request it answered
+
+        :param response: The requests.Response
+        :param bytes body: The response body, response.content if not given
+        """
+        if body is None:
+            body = response.content
+        now = datetime.datetime.now(datetime.timezone.utc)
+        date = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+        url = response.url
+        response_id = "<urn:uuid:" + str(uuid.uuid4()) + ">"
+        content_type = response.headers.get("Content-Type", "-").split(";")[0].strip() or "-"
+        payload_digest = digest(body)
+        response_record = record("response", response_block(response, body), {
+            "WARC-Record-ID": response_id,
+            "WARC-Date": date,
+            "WARC-Target-URI": url,
+            "Content-Type": "application/http;msgtype=response",
+            "WARC-Payload-Digest": payload_digest,
+        })
+        request_record = record("request", request_block(response), {
+            "WARC-Date": date,
+            "WARC-Target-URI": url,
+            "WARC-Concurrent-To": response_id,
+            "Content-Type": "application/http;msgtype=request",
+        })
+        with self.lock:
+            self.open_segment(now)
+            offset, length = self.append(response_record)
+            self.append(request_record)
+            self.index_lines.append(" ".join([
+                surt(url), now.strftime("%Y%m%d%H%M%S"), url, content_type, str(response.status_code),
+                payload_digest[len("sha1:"):], "-", "-", str(length), str(offset), os.path.basename(self.segment)
+            ]))
+            self.records += 1
+
+    def close(self):
+        """
+        Merge this run's lines into index.cdx, kept sorted so lookup can binary search it
+        """
+        with self.lock:
+            if len(self.index_lines) == 0:
+                return
+            path = os.path.join(self.directory, "index.cdx")
+            lines = []
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    lines = [line.rstrip("\n") for line in f if not line.startswith(" CDX")]
+            lines = sorted(lines + self.index_lines)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(" CDX N b a m s k r M S V g\n")
+                f.write("".join(line + "\n" for line in lines))
+            os.replace(path + ".tmp", path)
+            self.index_lines = []
+
+
+def first_line_at_least(f, key: bytes) -> int:
+    """
+    Binary search a sorted file for the offset of the first line >= key
+    """
+    f.seek(0, os.SEEK_END)
+    lo, hi = 0, f.tell()
+
+    def line_start(position):
+        # the start of the first line at or after position
+        if position == 0:
+            return 0
+        f.seek(position - 1)
+        f.readline()
+        return f.tell()
+
+    while lo < hi:
+        mid = (lo + hi) // 2
+        f.seek(line_start(mid))
+        line = f.readline()
+        if line != b"" and line < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return line_start(lo)
+
+
+def lookup(directory: str, url: str) -> list:
+    """
+    Find the captures of a url in directory/index.cdx, by binary search
+
+    :return: A list of dicts with timestamp, status, length, offset and filename, oldest first
+    """
+    path = os.path.join(directory, "index.cdx")
+    if not os.path.exists(path):
+        return []
+    key = (surt(url) + " ").encode("utf-8")
+    result = []
+    with open(path, "rb") as f:
+        f.seek(first_line_at_least(f, key))
+        for line in f:
+            if not line.startswith(key):
+                break
+            fields = line.decode("utf-8").split()
+            result.append({"timestamp": fields[1], "status": int(fields[4]), "length": int(fields[8]),
+                           "offset": int(fields[9]), "filename": fields[10]})
+    return result
+
+
+def read_record(directory: str, capture: dict) -> bytes:
+    """
+    Read one record (WARC headers and block) found by lookup, with a single seek
+    """
+    with open(os.path.join(directory, capture["filename"]), "rb") as f:
+        f.seek(capture["offset"])
+        return gzip.decompress(f.read(capture["length"]))
@@ -1,9 +1,28 @@
+from .scraper import Site, register, registry, load_sites, generate_all
 from .tj_ustc import tj_ustc_RSS
 
 __all__ = [
+    "Site",
+    "register",
+    "registry",
+    "load_sites",
+    "generate_all",
     "tj_ustc_RSS"
 ]
 
 
-def generate_RSS_feeds(output_dir: str):
-    tj_ustc_RSS(output_dir)
+def generate_RSS_feeds(output_dir: str, sites: list = None, minify: bool = False, max_workers: int = 4,
+                       enrich_options: dict = None):
+    """
+    Generate the feeds of the given sites concurrently
+
+    :param str output_dir: The output directory
+    :param list sites: The generate_feeds entries of config.yaml, every registered site if None
+    :param bool minify: Remove whitespace between tags from the saved xml
+    :param int max_workers: The maximum number of sites scraped at the same time
+    :param dict enrich_options: Options of enrich.enrich, for sites with a content selector
+
+    :return: A list of dicts with name, status, items, duration (and error), one per site
+    """
+    return generate_all(load_sites(sites), output_dir, minify=minify, max_workers=max_workers,
+                        enrich_options=enrich_options)
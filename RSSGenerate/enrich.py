@@ -0,0 +1,129 @@
+"""
+Full-text enrichment: fetch the article page of every generated item, and add its body to the feed.
+
+Article bodies go through the same asset localisation as RSSBackup (images are backed up to
+outputDir/static and their urls rewritten), and are cached by article url in
+outputDir/cache/articles/<site name>.json, so an article is fetched once in its lifetime:
+```json
+{
+    "http://www.tj.ustc.edu.cn/2023/0614/c30734a605933/page.htm": {
+        "sha256": "9f86d0...", "description": "First 200 characters...", "content": "<div>...</div>"
+    }
+}
+```
+sha256 is the hash of the body as fetched, before localisation.
+"""
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from bs4 import BeautifulSoup
+from RSSBackup.RSS import repeat_download, download_all, rewrite_urls
+from RSSBackup.extract import extract_urls
+from Utils.metrics import metrics
+from Utils.output import load_state, save_state
+import Utils.log
+
+
+def excerpt(content: str, length: int = 200) -> str:
+    """
+    The text of the first length characters of an html body
+    """
+    text = " ".join(BeautifulSoup(content, "html.parser").get_text(" ").split())
+    return text if len(text) <= length else text[:length] + "..."
+
+
+class ArticleCache:
+    def __init__(self, path: str):
+        self.path = path
+        self.articles = load_state(path, "article cache", {})
+
+    def get(self, url: str) -> Optional[dict]:
+        return self.articles.get(url)
+
+    def put(self, url: str, sha256: str, description: str, content: str):
+        self.articles[url] = {"sha256": sha256, "description": description, "content": content}
+
+    def save(self, keep: set):
+        """
+        Save the articles whose url is in keep, the others are dropped
+        """
+        self.articles = {url: article for url, article in self.articles.items() if url in keep}
+        save_state(self.path, self.articles)
+
+
+def fetch_article(url: str, extract, warc=None) -> Optional[str]:
+    """
+    Fetch an article page and extract its body
+
+    :param WARCWriter warc: Archive the fetched page in it
+
+    :return: The body html, None if it wasn't found on the page
+    :raises Exception: If failed to download
+    """
+    with metrics.span("fetch_article"):
+        data = repeat_download(url, warc=warc)
+    metrics.count("download_bytes", len(data), kind="article")
+    return extract(data.decode("utf-8", errors="replace"), url)
+
+
+def enrich(items: list, cache: ArticleCache, extract, options: dict, feed: Optional[str] = None) -> dict:
+    """
+    Add description and content to every item, from the cache or by fetching its article page
+
+    :param list items: The items, dicts with link, description and content are set in place
+    :param ArticleCache cache: The article cache of the site
+    :param extract: Function (page html, page url) -> body html with absolute urls, or None
+    :param dict options: workers (article pages fetched at the same time), and for the asset localisation
+                         asset_store, hosting_URL, max_workers, max_workers_per_host, max_asset_size,
+                         keep_oversized_url; without asset_store, asset urls are kept;
+                         warc, a WARCWriter the fetched article pages are archived in
+    :param str feed: The feed the assets are recorded for in the asset manifest
+
+    :return: dict with the number of articles cached, fetched and failed
+    :raises: None
+    """
+    stats = {"cached": 0, "fetched": 0, "failed": 0}
+    missing = [item["link"] for item in items if cache.get(item["link"]) is None]
+    missing = list(dict.fromkeys(missing))
+    stats["cached"] = len(items) - len(missing)
+
+    def task(url):
+        try:
+            return url, fetch_article(url, extract, options.get("warc"))
+        except Exception as e:
+            print("Error: " + url + ": " + str(e))
+            return url, None
+
+    with ThreadPoolExecutor(max_workers=options.get("workers", 4)) as pool:
+        bodies = {url: body for url, body in pool.map(Utils.log.run_in_context(task), missing)
+                  if body is not None}
+    stats["failed"] = len(missing) - len(bodies)
+
+    filenames = {}
+    store = options.get("asset_store")
+    if store is not None and len(bodies) > 0:
+        urls = {}
+        for body in bodies.values():
+            urls.update(extract_urls(body))
+        filenames, _ = download_all(list(urls), store,
+                                    max_workers=options.get("max_workers", 8),
+                                    max_workers_per_host=options.get("max_workers_per_host", 4),
+                                    max_size=options.get("max_asset_size"),
+                                    keep_oversized_url=options.get("keep_oversized_url", True),
+                                    feed=feed)
+
+    for url, body in bodies.items():
+        content = rewrite_urls(body, filenames, options.get("hosting_URL"))
+        cache.put(url, hashlib.sha256(body.encode("utf-8")).hexdigest(), excerpt(content), content)
+        stats["fetched"] += 1
+
+    for item in items:
+        article = cache.get(item["link"])
+        if article is not None:
+            item["description"] = article["description"]
+            item["content"] = article["content"]
+    cache.save({item["link"] for item in items})
+    metrics.count("articles", stats["cached"], source="cache")
+    metrics.count("articles", stats["fetched"], source="fetched")
+    metrics.count("articles", stats["failed"], source="failed")
+    return stats
@@ -0,0 +1,482 @@
+"""
+Declarative scrapers: make an RSS feed from a notice list page, given CSS selectors.
+
+A site is declared with the list page url, selectors for the items and their title / link / date,
+the date format and timezone, and the output filename, in config.yaml:
+```yaml
+generate_feeds:
+  - name: tj_ustc                 # a site registered in code, see tj_ustc.py
+  - name: example_dept
+    url: "https://example.ustc.edu.cn/tzgg/list.htm"
+    title: "Example Department"
+    description: "Example Department, https://example.ustc.edu.cn"
+    item: "#wp_news_w6 ul li"
+    itemTitle: "a"
+    itemLink: "a"
+    itemDate: "span.date"
+    dateFormat: "%Y-%m-%d"
+    timezone: "+08:00"
+    xmlFilename: "example_dept.xml"
+```
+An entry naming a registered site may override any of its fields, like url.
+Titles are the text of itemTitle (its title attribute if there is one), links the href of itemLink,
+resolved against the list page url.
+
+With pageURL (like "list{page}.htm", resolved against url) the following list pages are crawled too,
+up to maxPages, until a page shows an item seen before. Seen items are kept in
+outputDir/cache/sites/<name>.json, the feed is the newest `window` of them:
+```json
+{"items": [{"title": "...", "link": "http://www.tj.ustc.edu.cn/2023/0614/c30734a605933/page.htm", "date": "2023-06-14T00:00:00+08:00"}]}
+```
+So a steady-state run fetches exactly one page.
+
+Only the element named by the first part of the item selector (like #wp_news_w5) is parsed,
+the navigation, scripts and footers around it are skipped. An #id element is cut out of the page
+text before parsing, other elements are picked with a SoupStrainer. If that part doesn't match the
+item selector, the whole page is parsed instead. lxml is used if installed.
+
+With a content selector (like ".wp_articlecontent"), every item's article page is fetched once
+and its body added to the feed as content, with a text excerpt as description, see enrich.py.
+"""
+import datetime
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup, SoupStrainer
+from feedgen.feed import FeedGenerator
+from RSSBackup.RSS import repeat_download
+from Utils.catalog import FeedCatalog
+from Utils.publish import minify_xml
+from Utils.metrics import metrics
+from Utils.output import writer, load_state, save_state
+import Utils.log
+from .enrich import ArticleCache, enrich
+
+try:
+    import lxml
+    html_parser = "lxml"
+except ImportError:
+    html_parser = "html.parser"
+
+# config.yaml key -> Site attribute
+config_keys = {
+    "name": "name",
+    "url": "url",
+    "title": "title",
+    "description": "description",
+    "item": "item",
+    "itemTitle": "item_title",
+    "itemLink": "item_link",
+    "itemDate": "item_date",
+    "dateFormat": "date_format",
+    "timezone": "timezone",
+    "xmlFilename": "xml_filename",
+    "language": "language",
+    "ttl": "ttl",
+    "pageURL": "page_url",
+    "maxPages": "max_pages",
+    "window": "window",
+    "content": "content",
+}
+
+# Attributes made absolute in article bodies
+url_attributes = ["src", "href", "poster", "data-src", "data-original"]
+
+
+# The first compound of a CSS selector, if it is a plain tag, #id or .class (optionally after a tag)
+scope_matcher = re.compile(r"^([a-zA-Z][\w-]*)?(?:#([\w-]+)|\.([\w-]+))?(?=[\s>+~]|$)")
+
+
+def scope(selector: str) -> Optional[tuple]:
+    """
+    Get the first compound of selector
+
+    :return: (tag name, id, class), unused parts are None,
+             or None if the first compound is more than a tag, #id or .class
+    """
+    m = scope_matcher.match(selector.strip())
+    if m is None or m.group(0) == "":
+        return None
+    return m.groups()
+
+
+def scope_strainer(selector: str) -> Optional[SoupStrainer]:
+    """
+    Make a SoupStrainer keeping only the elements matching the first compound of selector
+
+    :return: The strainer, or None if the first compound is more than a tag, #id or .class
+    """
+    if scope(selector) is None:
+        return None
+    name, id, class_ = scope(selector)
+    if id is not None:
+        return SoupStrainer(name, id=id)
+    if class_ is not None:
+        return SoupStrainer(name, class_=class_)
+    return SoupStrainer(name)
+
+
+def cut_element(html: str, id: str) -> Optional[str]:
+    """
+    Cut the element with the given id out of the page text, by balancing its start and end tags
+
+    :return: The element's html, or None if it isn't found or its tags don't balance
+    """
+    m = re.search(r"<([a-zA-Z][\w-]*)\b[^>]*(?<![\w-])id\s*=\s*[\"']?" + re.escape(id) + r"[\"'\s/>]", html)
+    if m is None:
+        return None
+    tags = re.compile(r"<(/?)" + m.group(1) + r"\b[^>]*>", re.I)
+    depth = 0
+    for tag in tags.finditer(html, m.start()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return html[m.start():tag.end()]
+    return None
+
+
+def scoped_soup(html: str, selector: str) -> BeautifulSoup:
+    """
+    Parse only the part of the page the selector can match, see the module docstring
+
+    Falls back to the strainer, then to the whole page, when the narrower parse doesn't match the selector,
+    so a mis-cut never turns into an empty feed.
+    """
+    first = scope(selector)
+    if first is not None and first[1] is not None:
+        element = cut_element(html, first[1])
+        if element is not None:
+            soup = BeautifulSoup(element, html_parser)
+            if soup.select_one(selector) is not None:
+                return soup
+    strainer = scope_strainer(selector)
+    if strainer is not None:
+        soup = BeautifulSoup(html, html_parser, parse_only=strainer)
+        if soup.select_one(selector) is not None:
+            return soup
+    return BeautifulSoup(html, html_parser)
+
+
+def parse_timezone(value: str) -> datetime.timezone:
+    """
+    Parse a timezone like "+08:00" or "-05:30"
+    """
+    sign = -1 if value.startswith("-") else 1
+    hours, _, minutes = value.lstrip("+-").partition(":")
+    return datetime.timezone(sign * datetime.timedelta(hours=int(hours), minutes=int(minutes or 0)))
+
+
+class Site:
+    def __init__(self, name: str, url: str, title: str, item: str, item_title: str, item_link: str,
+                 item_date: str, date_format: str = "%Y-%m-%d", timezone: str = "+08:00",
+                 xml_filename: Optional[str] = None, description: str = "", language: str = "zh-CN",
+                 ttl: int = 5, page_url: Optional[str] = None, max_pages: int = 5, window: int = 100,
+                 content: Optional[str] = None):
+        """
+        :param str name: The site name, used in reports
+        :param str url: The notice list page
+        :param str title: The feed title
+        :param str item: CSS selector of the items on the list page
+        :param str item_title: CSS selector of an item's title, inside the item
+        :param str item_link: CSS selector of an item's link (the element with href), inside the item
+        :param str item_date: CSS selector of an item's date, inside the item
+        :param str date_format: strptime format of the date
+        :param str timezone: The timezone of the date, like "+08:00"
+        :param str xml_filename: The filename in outputDir/xml/, name + ".xml" if not given
+        :param str description: The feed description
+        :param str language: The feed language
+        :param int ttl: The feed ttl in minutes
+        :param str page_url: The list page number page (from 2), like "list{page}.htm", None if there is only one
+        :param int max_pages: The most list pages crawled in one run
+        :param int window: The number of newest items in the feed
+        :param str content: CSS selector of the body on an item's article page, None to not fetch articles
+        """
+        self.name = name
+        self.url = url
+        self.title = title
+        self.item = item
+        self.item_title = item_title
+        self.item_link = item_link
+        self.item_date = item_date
+        self.date_format = date_format
+        self.timezone = timezone
+        self.xml_filename = xml_filename if xml_filename is not None else name + ".xml"
+        self.description = description
+        self.language = language
+        self.ttl = ttl
+        self.page_url = page_url
+        self.max_pages = max_pages
+        self.window = window
+        self.content = content
+
+    @classmethod
+    def from_config(cls, config: dict, base: Optional["Site"] = None) -> "Site":
+        """
+        Make a site from a generate_feeds entry of config.yaml
+
+        :param dict config: The entry, with the keys in config_keys
+        :param Site base: The registered site of the same name, the entry overrides its fields
+
+        :raises ValueError: If a key is unknown or a required one is missing
+        """
+        unknown = set(config) - set(config_keys)
+        if len(unknown) > 0:
+            raise ValueError("Unknown keys " + ", ".join(sorted(unknown)) +
+                             " in generate_feeds entry " + str(config.get("name")))
+        fields = dict(vars(base)) if base is not None else {}
+        fields.update({config_keys[key]: value for key, value in config.items()})
+        try:
+            return cls(**fields)
+        except TypeError as e:
+            raise ValueError("Invalid generate_feeds entry " + str(config.get("name")) + ": " + str(e))
+
+    def page(self, number: int) -> str:
+        """
+        The url of list page number (from 1)
+        """
+        if number == 1:
+            return self.url
+        return urljoin(self.url, self.page_url.format(page=number))
+
+    def fetch(self, url: str) -> str:
+        """
+        Fetch a list page, retried with backoff and behind the host's circuit breaker like every download
+
+        :raises Exception: If failed to download after retrying
+        """
+        with metrics.span("fetch", site=self.name):
+            data = repeat_download(url)
+        metrics.count("pages_fetched", site=self.name)
+        metrics.count("download_bytes", len(data), kind="page")
+        return data.decode("utf-8", errors="replace")
+
+    def parse(self, html: str) -> list:
+        """
+        Parse a list page to a list of dicts with title, link and date
+
+        :param str html: The list page html
+
+        :return: A list of dicts, in page order
+        :rtype: list
+        """
+        tz = parse_timezone(self.timezone)
+        soup = scoped_soup(html, self.item)
+        result = []
+        for item in soup.select(self.item):
+            title = item.select_one(self.item_title)
+            link = item.select_one(self.item_link)
+            date = item.select_one(self.item_date)
+            if title is None or link is None or date is None or link.get("href") is None:
+                continue
+            result.append({
+                "title": title.get("title") or title.get_text(strip=True),
+                "link": urljoin(self.url, link["href"]),
+                "date": datetime.datetime.strptime(date.get_text(strip=True), self.date_format).replace(tzinfo=tz)
+            })
+        return result
+
+    def article(self, html: str, url: str) -> Optional[str]:
+        """
+        Extract the body of an article page, without scripts, with absolute urls
+
+        :param str html: The article page html
+        :param str url: The article page url
+
+        :return: The body html, None if the content selector doesn't match
+        """
+        soup = scoped_soup(html, self.content)
+        body = soup.select_one(self.content)
+        if body is None:
+            return None
+        for tag in body.find_all(["script", "style"]):
+            tag.decompose()
+        for tag in body.find_all(True):
+            for name in url_attributes:
+                if tag.get(name):
+                    tag[name] = urljoin(url, tag[name])
+            if tag.get("srcset"):
+                tag["srcset"] = ", ".join(
+                    " ".join([urljoin(url, parts[0])] + parts[1:])
+                    for parts in (candidate.split() for candidate in tag["srcset"].split(",")) if len(parts) > 0)
+        return str(body)
+
+    def crawl(self, seen: set) -> tuple:
+        """
+        Fetch list pages until one shows an item in seen, or max_pages is reached
+
+        :param set seen: The links seen by earlier runs
+
+        :return: (the items not seen before, newest first, number of pages fetched)
+        :raises Exception: If fetching or parsing the first page failed
+        """
+        new_items = []
+        seen = set(seen)
+        last_page = self.max_pages if self.page_url is not None else 1
+        for number in range(1, last_page + 1):
+            try:
+                html = self.fetch(self.page(number))
+            except Exception as e:
+                if number == 1:
+                    raise
+                print("Error: " + str(e))
+                print("Stopping at page " + str(number))
+                return new_items, number - 1
+            with metrics.span("parse", site=self.name):
+                items = self.parse(html)
+            fresh = [item for item in items if item["link"] not in seen]
+            new_items.extend(fresh)
+            seen.update(item["link"] for item in fresh)
+            if len(items) == 0 or len(fresh) < len(items):
+                return new_items, number
+        return new_items, last_page
+
+    def index_path(self, output_dir: str) -> str:
+        return os.path.join(output_dir, "cache", "sites", self.name + ".json")
+
+    def load_index(self, output_dir: str) -> list:
+        """
+        Load the items seen by earlier runs, newest first, [] if there is no (usable) index
+        """
+        path = self.index_path(output_dir)
+        index = load_state(path, "site index")
+        if index is None:
+            return []
+        try:
+            items = index["items"]
+            for item in items:
+                item["date"] = datetime.datetime.fromisoformat(item["date"])
+            return items
+        except Exception as e:
+            print("Error: " + str(e))
+            print("Ignoring broken site index " + path)
+            return []
+
+    def save_index(self, output_dir: str, items: list):
+        save_state(self.index_path(output_dir),
+                   {"items": [dict(item, date=item["date"].isoformat()) for item in items]})
+
+    def make_feed(self, items: list) -> str:
+        fg = FeedGenerator()
+        fg.title(self.title)
+        fg.description(self.description)
+        fg.link(href=self.url, rel="alternate")
+        fg.language(self.language)
+        fg.lastBuildDate(datetime.datetime.now(datetime.timezone.utc))
+        fg.ttl(self.ttl)
+
+        for item in items:
+            fe = fg.add_entry()
+            fe.title(item["title"])
+            fe.link(href=item["link"])
+            fe.pubDate(item["date"])
+            if item.get("description") is not None:
+                fe.description(item["description"])
+            if item.get("content") is not None:
+                fe.content(item["content"], type="CDATA")
+        return fg.rss_str().decode("utf-8")
+
+    def generate(self, output_dir: str, minify: bool = False, enrich_options: Optional[dict] = None,
+                 catalog: Optional[FeedCatalog] = None) -> dict:
+        """
+        Scrape the site and save the feed to outputDir/xml/<xml_filename>
+
+        :param str output_dir: The output directory
+        :param bool minify: Remove whitespace between tags from the saved xml
+        :param dict enrich_options: Options of enrich.enrich, for sites with a content selector
+        :param FeedCatalog catalog: The feed catalog to record the feed in, shared by sites generated at the same time
+
+        :return: dict with the number of items in the feed, new items, and pages fetched
+        :raises Exception: If fetching or parsing the first page failed
+        """
+        os.makedirs(os.path.join(output_dir, "xml"), exist_ok=True)
+        known = self.load_index(output_dir)
+        new_items, pages = self.crawl({item["link"] for item in known})
+        new_links = {item["link"] for item in new_items}
+        items = new_items + [item for item in known if item["link"] not in new_links]
+        # sorted is stable, items of the same day keep their page order
+        items = sorted(items, key=lambda item: item["date"], reverse=True)[:self.window]
+        self.save_index(output_dir, items)
+
+        articles = None
+        if self.content is not None:
+            with metrics.span("enrich", site=self.name):
+                articles = enrich(items, ArticleCache(os.path.join(output_dir, "cache", "articles", self.name + ".json")),
+                                  self.article, enrich_options or {}, feed=self.xml_filename)
+
+        with metrics.span("write_xml", site=self.name):
+            xml = self.make_feed(items)
+            if minify:
+                xml = minify_xml(xml)
+            path = os.path.join(output_dir, "xml", self.xml_filename)
+            written = writer.write(path, xml)
+            if written:
+                (catalog if catalog is not None else FeedCatalog(output_dir)).update(self.xml_filename, xml)
+        print("RSS generated: " + path + " (" + str(len(new_items)) + " new items, " +
+              str(pages) + " pages" + ("" if written else ", unchanged") + ")")
+        if articles is not None:
+            print("Articles: " + str(articles["fetched"]) + " fetched, " + str(articles["cached"]) +
+                  " cached, " + str(articles["failed"]) + " failed")
+        return {"items": len(items), "new": len(new_items), "pages": pages}
+
+
+# name -> Site, filled by the site modules on import
+registry = {}
+
+
+def register(site: Site) -> Site:
+    registry[site.name] = site
+    return site
+
+
+def load_sites(entries: Optional[list]) -> list:
+    """
+    Get the sites to generate from the generate_feeds entries of config.yaml
+
+    :param list entries: The entries, if None every registered site is generated
+
+    :return: A list of Site
+    :raises ValueError: If an entry is invalid
+    """
+    if entries is None:
+        return list(registry.values())
+    return [Site.from_config(entry, registry.get(entry.get("name"))) for entry in entries]
+
+
+def generate_site(site: Site, output_dir: str, minify: bool, enrich_options: Optional[dict],
+                  catalog: Optional[FeedCatalog] = None) -> dict:
+    start = time.time()
+    with Utils.log.group(), metrics.span("generate_site", site=site.name):
+        try:
+            result = site.generate(output_dir, minify=minify, enrich_options=enrich_options, catalog=catalog)
+            result["status"] = "generated"
+        except Exception as e:
+            print("Error: " + site.name + ": " + str(e))
+            metrics.count("sites_failed")
+            result = {"status": "failed", "items": 0, "new": 0, "pages": 0, "error": str(e)}
+    result["name"] = site.name
+    result["duration"] = time.time() - start
+    return result
+
+
+def generate_all(sites: list, output_dir: str, minify: bool = False, max_workers: int = 4,
+                 enrich_options: Optional[dict] = None) -> list:
+    """
+    Generate every site concurrently, sharing Utils.http.client's connection pools and one feed catalog
+
+    :param list sites: The sites
+    :param str output_dir: The output directory
+    :param bool minify: Remove whitespace between tags from the saved xml
+    :param int max_workers: The maximum number of sites scraped at the same time
+    :param dict enrich_options: Options of enrich.enrich, for sites with a content selector
+
+    :return: A list of dicts with name, status ("generated" or "failed"), items, new, pages, duration
+             and error if failed
+    :raises: None
+    """
+    catalog = FeedCatalog(output_dir)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(
+            Utils.log.run_in_context(lambda site: generate_site(site, output_dir, minify, enrich_options, catalog)),
+            sites))
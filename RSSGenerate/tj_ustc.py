@@ -1,25 +1,9 @@
 """
-Make RSS feed from: http://www.tj.ustc.edu.cn/tzgg/list.htm
+Make RSS feed from: http://www.tj.ustc.edu.cn/tzgg/list.htm, list2.htm, ...
 
 Save rss to outputDir/xml/tj_ustc.xml
 """
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-import os
-from bs4 import BeautifulSoup
-from feedgen.feed import FeedGenerator
-import time
-import datetime
-
-url = "http://www.tj.ustc.edu.cn/tzgg/list.htm"
-title = "体育教学中心"
-description = "体育教学中心，http://www.tj.ustc.edu.cn"
-
-headers = {
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36 Edg/113.0.1774.57"
-}
+from .scraper import Site, register
 
 """
 HTML looks like this:
@@ -44,7 +28,7 @@ HTML looks like this:
 ```
 (Unnecessary parts are omitted)
 
-First we need to parse a given html string like this one to a list like this:
+The site is declared by its selectors, see scraper.py, parsing the page gives a list like this:
 ```python
 [
     {
@@ -62,6 +46,26 @@ First we need to parse a given html string like this one to a list like this:
 """
 
 
+site = register(Site(
+    name="tj_ustc",
+    url="http://www.tj.ustc.edu.cn/tzgg/list.htm",
+    title="体育教学中心",
+    description="体育教学中心，http://www.tj.ustc.edu.cn",
+    item="#wp_news_w5 ul li.item",
+    item_title="a[title]",
+    item_link="a",
+    item_date="time",
+    date_format="%Y-%m-%d",
+    # dates on the page are UTC+8
+    timezone="+08:00",
+    xml_filename="tj_ustc.xml",
+    # older notices are on list2.htm, list3.htm, ...
+    page_url="list{page}.htm",
+    # the notice text on every .../page.htm
+    content=".wp_articlecontent",
+))
+
+
 def parseHTML(html: str):
     """
     Parse a given html string to a list of dicts
@@ -72,63 +76,21 @@ def parseHTML(html: str):
     :rtype: list
     :raises: None
     """
-    soup = BeautifulSoup(html, "html.parser")
-    ul = soup.find("div", {"id": "wp_news_w5"}).find("ul")
-    items = ul.find_all("li", {"class": "item"})
-    result = []
-    for item in items:
-        date = item.find("time").text
-        # this is UTC+8 time, mark with timezone
-        date_parsed = datetime.datetime.strptime(
-            date, "%Y-%m-%d").astimezone(tz=datetime.timezone(datetime.timedelta(hours=8)))
-        result.append({
-            "title": item.find("a").text,
-            # 'http://www.tj.ustc.edu.cn' + '/2023/0614/c30734a605933/page.htm
-            "link": 'http://www.tj.ustc.edu.cn' + item.find("a")['href'],
-            "date": date_parsed
-        })
-    return result
+    return site.parse(html)
 
 
-def tj_ustc_RSS(output_dir: str):
+def tj_ustc_RSS(output_dir: str, minify: bool = False):
     """
-    Make RSS feed from: http://www.tj.ustc.edu.cn/tzgg/list.htm, save rss to outputDir/xml/tj_ustc.xml
+    Make RSS feed from: http://www.tj.ustc.edu.cn/tzgg/list.htm (and the following pages, down to
+    the notices seen before), save rss to outputDir/xml/tj_ustc.xml
 
     :param str output_dir: The directory to save the generated RSS feed
+    :param bool minify: Remove whitespace between tags from the saved xml
 
     :return: None
-    :raises: None
+    :raises Exception: If fetching or parsing failed
     """
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    if not os.path.exists(output_dir + "/xml"):
-        os.makedirs(output_dir + "/xml")
-
-    s = requests.Session()
-    s.mount("http://", HTTPAdapter(max_retries=3))
-    r = s.get(url, headers=headers)
-    r.encoding = "utf-8"
-    html = r.text
-
-    items = parseHTML(html)
-
-    fg = FeedGenerator()
-    fg.title(title)
-    fg.description(description)
-    fg.link(href="http://www.tj.ustc.edu.cn/tzgg/list.htm", rel="alternate")
-    fg.language("zh-CN")
-    fg.lastBuildDate(datetime.datetime.utcnow(
-    ).astimezone(tz=datetime.timezone.utc))
-    fg.ttl(5)
-
-    for item in items:
-        fe = fg.add_entry()
-        fe.title(item["title"])
-        fe.link(href=item["link"])
-        fe.pubDate(item["date"])
-
-    fg.rss_file(output_dir + "/xml/tj_ustc.xml")
-    print("RSS generated: " + output_dir + "/xml/tj_ustc.xml")
+    site.generate(output_dir, minify=minify)
 
 
 if __name__ == "__main__":
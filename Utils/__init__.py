@@ -0,0 +1,14 @@
+from .http import HTTPClient, client
+from .metrics import Metrics, metrics
+from .output import OutputWriter, writer
+from . import log
+
+__all__ = [
+    "HTTPClient",
+    "client",
+    "Metrics",
+    "metrics",
+    "OutputWriter",
+    "writer",
+    "log"
+]
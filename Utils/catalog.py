@@ -0,0 +1,104 @@
+"""
+Metadata catalog of every xml file in outputDir/xml/, saved to outputDir/cache/catalog.json
+
+Written by the stages that write the xml files (RSSBackup, RSSGenerate), read by the indexers,
+so making an index never has to parse a whole feed:
+```json
+{
+    "mp_ustc_main.xml": {
+        "title": "公众号「中国科学技术大学」",
+        "entries": 20,
+        "newest": "2023-06-14T08:00:00+00:00",
+        "latest": [{"title": "...", "link": "https://mp.weixin.qq.com/s/abc"}],
+        "bytes": 183022,
+        "sha256": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
+    }
+}
+```
+"""
+import os
+import threading
+from typing import Optional
+from .feedxml import describe_feed, channel_title
+from .output import load_state, save_state
+
+# how much of a file header_title reads, the channel title comes before any entry
+header_size = 8 * 1024
+
+
+def catalog_path(output_dir: str) -> str:
+    return os.path.join(output_dir, "cache", "catalog.json")
+
+
+def header_title(path: str) -> str:
+    """
+    Read the feed title from the start of an xml file, without parsing the whole file
+
+    :param str path: The xml file
+
+    :return: The title, empty if not found
+    """
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        head = f.read(header_size)
+    for tag in ["<item", "<entry"]:
+        if tag in head:
+            head = head[:head.index(tag)]
+    return channel_title(head)
+
+
+class FeedCatalog:
+    def __init__(self, output_dir: str):
+        self.path = catalog_path(output_dir)
+        self.xml_dir = os.path.join(output_dir, "xml")
+        self.lock = threading.Lock()
+        self.feeds = load_state(self.path, "feed catalog", {})
+
+    def update(self, xml_filename: str, xml: str):
+        """
+        Record the metadata of an xml file that was just written, and save the catalog
+
+        :param str xml_filename: The filename inside outputDir/xml/
+        :param str xml: The content written
+        """
+        description = describe_feed(xml)
+        with self.lock:
+            self.feeds[xml_filename] = description
+        self.save()
+
+    def get(self, xml_filename: str) -> Optional[dict]:
+        """
+        Get the metadata of an xml file, checked against the file's size
+
+        :param str xml_filename: The filename inside outputDir/xml/
+
+        :return: The metadata, or None if the file isn't in the catalog or changed since
+        """
+        with self.lock:
+            description = self.feeds.get(xml_filename)
+        path = os.path.join(self.xml_dir, xml_filename)
+        if description is None or not os.path.isfile(path) or os.path.getsize(path) != description["bytes"]:
+            return None
+        return description
+
+    def list(self) -> list:
+        """
+        List every xml file in outputDir/xml/ with its metadata
+
+        :return: A list of dicts with filename, path and title,
+            plus the catalog's metadata for files in the catalog
+            (files missing from it get their title from header_title)
+        """
+        result = []
+        for xml_filename in os.listdir(self.xml_dir):
+            path = os.path.join(self.xml_dir, xml_filename)
+            if not os.path.isfile(path) or not xml_filename.endswith(".xml"):
+                continue
+            description = self.get(xml_filename)
+            if description is None:
+                description = {"title": header_title(path)}
+            result.append({**description, "filename": xml_filename, "path": path})
+        return result
+
+    def save(self):
+        with self.lock:
+            save_state(self.path, self.feeds)
@@ -0,0 +1,127 @@
+"""
+Cheap, regex based helpers for feed xml (RSS <item> or Atom <entry>),
+for when a full feedparser parse isn't needed.
+"""
+import datetime
+import email.utils
+import hashlib
+import html
+import re
+from typing import Optional
+
+entry_matcher = re.compile(r"<(item|entry)\b[^>]*>.*?</\1\s*>", re.S)
+key_matchers = [
+    re.compile(r"<guid\b[^>]*>(.*?)</guid>", re.S),
+    re.compile(r"<id\b[^>]*>(.*?)</id>", re.S),
+    re.compile(r"<link\b[^>]*>(.*?)</link>", re.S),
+    re.compile(r"<link\b[^>]*href=\"([^\"]*)\"", re.S),
+]
+date_matchers = [
+    re.compile(r"<pubDate\b[^>]*>(.*?)</pubDate>", re.S),
+    re.compile(r"<published\b[^>]*>(.*?)</published>", re.S),
+    re.compile(r"<updated\b[^>]*>(.*?)</updated>", re.S),
+    re.compile(r"<dc:date\b[^>]*>(.*?)</dc:date>", re.S),
+]
+
+
+def strip_cdata(text: str) -> str:
+    text = text.strip()
+    if text.startswith("<![CDATA[") and text.endswith("]]>"):
+        text = text[9:-3]
+    return text.strip()
+
+
+def split_entries(xml: str):
+    """
+    Split a feed into the text before the first entry, the entries, and the text after the last entry
+
+    :param str xml: The feed xml
+
+    :return: (head, list of entry strings, tail), entries is empty if no entry is found
+    """
+    entries = [m for m in entry_matcher.finditer(xml)]
+    if len(entries) == 0:
+        return xml, [], ""
+    return xml[:entries[0].start()], [m.group(0) for m in entries], xml[entries[-1].end():]
+
+
+def entry_key(entry: str) -> str:
+    for matcher in key_matchers:
+        m = matcher.search(entry)
+        if m is not None and len(strip_cdata(m.group(1))) > 0:
+            return strip_cdata(m.group(1))
+    return hashlib.sha256(entry.encode("utf-8")).hexdigest()
+
+
+def entry_date(entry: str) -> Optional[datetime.datetime]:
+    for matcher in date_matchers:
+        m = matcher.search(entry)
+        if m is None:
+            continue
+        text = strip_cdata(m.group(1))
+        try:
+            date = email.utils.parsedate_to_datetime(text)
+        except (TypeError, ValueError):
+            try:
+                date = datetime.datetime.fromisoformat(
+                    text.replace("Z", "+00:00"))
+            except ValueError:
+                continue
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return date
+    return None
+
+
+title_matcher = re.compile(r"<title\b[^>]*>(.*?)</title>", re.S)
+
+
+def channel_title(head: str) -> str:
+    """
+    Find the feed's title in the part of the xml before the first entry
+
+    :param str head: The xml before the first entry (or the start of the file)
+
+    :return: The title, empty if not found
+    """
+    m = title_matcher.search(head)
+    if m is None:
+        return ""
+    return html.unescape(strip_cdata(m.group(1)))
+
+
+def entry_title(entry: str) -> str:
+    m = title_matcher.search(entry)
+    return "" if m is None else html.unescape(strip_cdata(m.group(1)))
+
+
+def entry_link(entry: str) -> str:
+    for matcher in key_matchers[2:]:
+        m = matcher.search(entry)
+        if m is not None and len(strip_cdata(m.group(1))) > 0:
+            return html.unescape(strip_cdata(m.group(1)))
+    return ""
+
+
+def describe_feed(xml: str, latest: int = 10) -> dict:
+    """
+    Describe a feed for the feed catalog
+
+    :param str xml: The feed xml
+    :param int latest: How many of the first entries to list in latest
+
+    :return: A dict with title, entries (count), newest (iso date of the newest entry, or None),
+        latest (title and link of the first entries), bytes and sha256
+    """
+    head, entries, _ = split_entries(xml)
+    dates = [date for date in (entry_date(entry)
+                               for entry in entries) if date is not None]
+    data = xml.encode("utf-8")
+    return {
+        "title": channel_title(head),
+        "entries": len(entries),
+        "newest": max(dates).isoformat() if len(dates) > 0 else None,
+        "latest": [{"title": entry_title(entry), "link": entry_link(entry)} for entry in entries[:latest]],
+        "bytes": len(data),
+        "sha256": hashlib.sha256(data).hexdigest()
+    }
@@ -0,0 +1,98 @@
+"""
+Shared HTTP client for RSSBackup and RSSGenerate.
+
+One requests.Session with per-host keep-alive connection pools, shared default headers and timeouts.
+gzip/deflate responses are decoded transparently, brotli too if the optional brotli package is installed.
+"""
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+headers = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "Accept-Encoding": make_headers(accept_encoding=True)["accept-encoding"],
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36 Edg/113.0.1774.57"
+}
+
+
+class HTTPClient:
+    def __init__(self, timeout=(10, 30), num_pools: int = 32, pool_maxsize: int = 16):
+        """
+        :param timeout: Default (connect, read) timeout in seconds
+        :param int num_pools: The number of hosts to keep a connection pool for
+        :param int pool_maxsize: The number of keep-alive connections kept per host
+        """
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        # only failed connects are retried here, callers decide how to retry everything else
+        adapter = HTTPAdapter(pool_connections=num_pools, pool_maxsize=pool_maxsize,
+                              max_retries=Retry(total=None, connect=3, read=0, status=0, redirect=10))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.adapter = adapter
+        self.lock = threading.Lock()
+        self.requests = 0
+        # pool counts at the last reset, the pools themselves live as long as the client
+        self.baseline = {"opened": 0, "pooled_requests": 0}
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        GET the given url, takes the same arguments as requests.get
+
+        :param str url: The url to get
+
+        :return: The response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        with self.lock:
+            self.requests += 1
+        return self.session.get(url, **kwargs)
+
+    def reset(self):
+        """
+        Start counting from zero, called at the start of a run, the kept-alive connections stay open
+        """
+        counts = self.pool_counts()
+        with self.lock:
+            self.requests = 0
+            self.baseline = counts
+
+    def pool_counts(self) -> dict:
+        pools = self.adapter.poolmanager.pools
+        opened = 0
+        pooled_requests = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            pooled_requests += pool.num_requests
+        return {"opened": opened, "pooled_requests": pooled_requests}
+
+    def stats(self) -> dict:
+        """
+        Count connections opened and requests that reused a kept-alive connection, since the last reset
+
+        :return: A dict with requests, opened and reused
+
+        :description:
+            Counts come from the hosts' urllib3 pools,
+            hosts whose pool got evicted (more than num_pools hosts) are no longer counted.
+        """
+        counts = self.pool_counts()
+        with self.lock:
+            baseline = self.baseline
+            requests_count = self.requests
+        opened = max(counts["opened"] - baseline["opened"], 0)
+        pooled_requests = max(counts["pooled_requests"] - baseline["pooled_requests"], 0)
+        return {
+            "requests": requests_count,
+            "opened": opened,
+            "reused": max(pooled_requests - opened, 0)
+        }
+
+
+client = HTTPClient()
@@ -0,0 +1,67 @@
+"""
+Group print output per task, so output of tasks running in parallel doesn't interleave.
+
+Inside `with group():` everything printed (also from threads started through `run_in_context`)
+is buffered, and written to the real stdout in one piece when the block ends.
+"""
+import contextvars
+import io
+import sys
+import threading
+from contextlib import contextmanager
+
+current_buffer = contextvars.ContextVar("current_buffer", default=None)
+write_lock = threading.Lock()
+
+
+class GroupedStdout:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        buffer = current_buffer.get()
+        if buffer is not None:
+            return buffer.write(text)
+        with write_lock:
+            return self.stream.write(text)
+
+    def flush(self):
+        if current_buffer.get() is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def install():
+    """
+    Replace sys.stdout so it honours group(), does nothing if already installed
+    """
+    if not isinstance(sys.stdout, GroupedStdout):
+        sys.stdout = GroupedStdout(sys.stdout)
+
+
+@contextmanager
+def group():
+    """
+    Buffer everything printed inside the block, write it out at once when the block ends
+    """
+    install()
+    buffer = io.StringIO()
+    token = current_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        current_buffer.reset(token)
+        with write_lock:
+            sys.stdout.stream.write(buffer.getvalue())
+            sys.stdout.stream.flush()
+
+
+def run_in_context(func):
+    """
+    Wrap func to run in a copy of the caller's context, so it prints into the caller's group
+    when submitted to a thread pool, every call gets its own copy so the wrapper can be mapped
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
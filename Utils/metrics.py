@@ -0,0 +1,134 @@
+"""
+Lightweight run instrumentation: nested timing spans and counters.
+
+```python
+with metrics.span("backup_feed", feed="mp_ustc_main.xml"):
+    metrics.count("download_bytes", len(data), kind="feed")
+```
+
+Spans nest through contextvars, so spans opened in threads started with Utils.log.run_in_context
+nest under the span that started them. Metrics.write puts metrics.json and metrics.prom
+(Prometheus text format) into outputDir/metrics/, which outputDir/.gitignore keeps out of the
+published gh-pages commit, as they change on every run.
+"""
+import contextvars
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from .output import git_ignore
+
+current_path = contextvars.ContextVar("current_path", default="")
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def label_text(labels: dict) -> str:
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in sorted(labels.items())) + "}"
+
+
+class Metrics:
+    def __init__(self, prefix: str = "lu_rss"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything recorded, called at the start of a run
+        """
+        with self.lock:
+            self.started = time.time()
+            self.counters = {}
+            self.spans = {}
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """
+        Time the block as a span, nested under the enclosing span
+
+        :param str name: The span name
+        :param labels: Labels telling spans of the same name apart, like feed="..."
+        """
+        path = current_path.get() + "/" + name + label_text(labels)
+        token = current_path.set(path)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            current_path.reset(token)
+            with self.lock:
+                span = self.spans.setdefault(
+                    path, {"name": name, "labels": labels, "count": 0, "seconds": 0.0, "max_seconds": 0.0})
+                span["count"] += 1
+                span["seconds"] += seconds
+                span["max_seconds"] = max(span["max_seconds"], seconds)
+
+    def count(self, name: str, value: float = 1, **labels):
+        """
+        Add value to a counter
+
+        :param str name: The counter name
+        :param float value: The amount to add
+        :param labels: Labels telling counters of the same name apart, like kind="asset"
+        """
+        key = name + label_text(labels)
+        with self.lock:
+            counter = self.counters.setdefault(
+                key, {"name": name, "labels": labels, "value": 0})
+            counter["value"] += value
+
+    def to_json(self) -> dict:
+        with self.lock:
+            return {
+                "started": datetime.datetime.fromtimestamp(self.started, datetime.timezone.utc).isoformat(timespec="seconds"),
+                "seconds": time.time() - self.started,
+                "spans": [{"path": path, **span} for path, span in sorted(self.spans.items())],
+                "counters": [counter for _, counter in sorted(self.counters.items())]
+            }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            lines.append(f"# TYPE {self.prefix}_run_seconds gauge")
+            lines.append(
+                f"{self.prefix}_run_seconds {time.time() - self.started:.6f}")
+            lines.append(f"# TYPE {self.prefix}_span_seconds_total counter")
+            lines.append(f"# TYPE {self.prefix}_span_count_total counter")
+            for path, span in sorted(self.spans.items()):
+                labels = label_text({"span": path})
+                lines.append(
+                    f"{self.prefix}_span_seconds_total{labels} {span['seconds']:.6f}")
+                lines.append(
+                    f"{self.prefix}_span_count_total{labels} {span['count']}")
+            names = sorted(set(counter["name"]
+                           for counter in self.counters.values()))
+            for name in names:
+                lines.append(f"# TYPE {self.prefix}_{name}_total counter")
+                for _, counter in sorted(self.counters.items()):
+                    if counter["name"] == name:
+                        lines.append(
+                            f"{self.prefix}_{name}_total{label_text(counter['labels'])} {counter['value']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_dir: str):
+        """
+        Write metrics.json and metrics.prom into outputDir/metrics/, and make sure outputDir/.gitignore ignores it
+        """
+        metrics_dir = os.path.join(output_dir, "metrics")
+        os.makedirs(metrics_dir, exist_ok=True)
+        git_ignore(output_dir, "/metrics/")
+        with open(os.path.join(metrics_dir, "metrics.json"), "w") as f:
+            json.dump(self.to_json(), f, indent=4, ensure_ascii=False)
+        with open(os.path.join(metrics_dir, "metrics.prom"), "w") as f:
+            f.write(self.to_prometheus())
+
+
+metrics = Metrics()
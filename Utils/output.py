@@ -0,0 +1,157 @@
+"""
+Write-if-changed output, so a run that changed nothing leaves the published files of outputDir
+(and the gh-pages commit) alone. Files that change on every run (metrics) or only grow (WARC segments)
+are kept out of gh-pages by outputDir/.gitignore, see git_ignore.
+
+A file is only written when its semantic content differs from the file on disk:
+volatile fields (<lastBuildDate>, the feed's own <updated>) of xml are ignored, and json is compared
+parsed, so the copy minified by Utils.publish equals the freshly made one.
+Writes go through a temporary file and os.replace, so readers never see a half written file.
+The json state files under outputDir/cache are loaded and saved the same way with load_state / save_state.
+
+```python
+from Utils.output import writer
+if writer.write(path, xml):
+    catalog.update(filename, xml)
+print(writer.stats())
+```
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Union
+from .feedxml import split_entries
+
+# Feed level tags that change on every build without the feed changing
+volatile_matchers = [
+    re.compile(r"<lastBuildDate\b[^>]*>.*?</lastBuildDate\s*>", re.S),
+    re.compile(r"<updated\b[^>]*>.*?</updated\s*>", re.S),
+]
+
+
+def semantic_text(xml: str) -> str:
+    """
+    The xml with the volatile tags of the feed head (before the first entry) removed
+    """
+    head, entries, tail = split_entries(xml)
+    for matcher in volatile_matchers:
+        head = matcher.sub("", head)
+    return head + "".join(entries) + tail
+
+
+def semantic_hash(path: str, data: bytes) -> str:
+    """
+    sha256 of the data, ignoring volatile fields if path is an xml file, and formatting if it is a json file
+    """
+    if path.endswith(".xml"):
+        data = semantic_text(data.decode("utf-8", errors="replace")).encode("utf-8")
+    elif path.endswith(".json"):
+        try:
+            data = json.dumps(json.loads(data), sort_keys=True, separators=(",", ":")).encode("utf-8")
+        except ValueError:
+            pass
+    return hashlib.sha256(data).hexdigest()
+
+
+class OutputWriter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.written = 0
+        self.skipped = 0
+
+    def write(self, path: str, data: Union[str, bytes], semantic: bool = True) -> bool:
+        """
+        Write data to path, unless the file there has the same content
+
+        :param str path: The file path, its directory is created if needed
+        :param data: The content, str is written as utf-8
+        :param bool semantic: Ignore volatile fields (xml build dates), otherwise compare bytes
+
+        :return: True if the file was written, False if it was left alone
+        :raises: OSError if failed to write
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                old = f.read()
+            if old == data or (semantic and semantic_hash(path, old) == semantic_hash(path, data)):
+                with self.lock:
+                    self.skipped += 1
+                return False
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        with self.lock:
+            self.written += 1
+        return True
+
+    def reset(self):
+        """
+        Forget the counts, called at the start of a run
+        """
+        with self.lock:
+            self.written = 0
+            self.skipped = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"written": self.written, "skipped": self.skipped}
+
+
+writer = OutputWriter()
+
+
+def load_state(path: str, what: str, default=None):
+    """
+    Load a json state file saved by an earlier run
+
+    :param str path: The json file
+    :param str what: What the file is, for the message if it is broken, like "breaker state"
+
+    :return: The loaded data, or default if the file doesn't exist or is broken
+    """
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print("Error: " + str(e))
+        print("Ignoring broken " + what + " " + path)
+        return default
+
+
+def save_state(path: str, data):
+    """
+    Save a json state file through a temporary file and os.replace, creating its directory if needed
+
+    :raises: OSError if failed to write
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def git_ignore(output_dir: str, entry: str):
+    """
+    Make sure outputDir/.gitignore has the given entry, so it isn't published with gh-pages
+
+    :param str output_dir: The output directory
+    :param str entry: The .gitignore line, like /metrics/
+    """
+    path = os.path.join(output_dir, ".gitignore")
+    ignored = ""
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            ignored = f.read()
+    if entry in ignored.splitlines():
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(("" if ignored == "" or ignored.endswith("\n") else "\n") + entry + "\n")
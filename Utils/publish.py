@@ -0,0 +1,117 @@
+"""
+Publish-time output optimization: minify xml and json, and precompress them for the CDN.
+
+Every published file (xml/*.xml, *.json, README.md in outputDir) gets .gz and .br variants next to it,
+only rewritten when the file's content changed since the last run (tracked in outputDir/cache/published.json).
+.br variants need the optional brotli package.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from .catalog import FeedCatalog
+from .output import writer, load_state, save_state
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+cdata_matcher = re.compile(r"(<!\[CDATA\[.*?\]\]>)", re.S)
+whitespace_matcher = re.compile(r">\s+<")
+
+
+def minify_xml(xml: str) -> str:
+    """
+    Remove whitespace between tags, CDATA sections are kept intact
+
+    :param str xml: The xml string
+
+    :return: The minified xml string
+    """
+    parts = cdata_matcher.split(xml)
+    # odd parts are CDATA sections
+    return "".join(part if i % 2 == 1 else whitespace_matcher.sub("><", part)
+                   for i, part in enumerate(parts)).strip()
+
+
+def minify_json(text: str) -> str:
+    """
+    Remove insignificant whitespace from a json string
+    """
+    return json.dumps(json.loads(text), separators=(",", ":"))
+
+
+def published_files(output_dir: str) -> list:
+    """
+    List the files (relative to output_dir) that get published
+    """
+    result = []
+    xml_dir = os.path.join(output_dir, "xml")
+    if os.path.isdir(xml_dir):
+        result += ["xml/" + name for name in sorted(os.listdir(xml_dir))
+                   if name.endswith(".xml")]
+    result += [name for name in sorted(os.listdir(output_dir))
+               if name.endswith(".json") or name == "README.md"]
+    return result
+
+
+def publish(output_dir: str, minify: bool = True) -> dict:
+    """
+    Minify and precompress every published file in output_dir
+
+    :param str output_dir: The output directory
+    :param bool minify: Minify xml and json files in place,
+        xml files are normally minified when written already, so this only catches the rest
+
+    :return: A dict with files, changed (files), bytes (before minify), minified, gz and br (total sizes)
+    :raises: None
+    """
+    state_path = os.path.join(output_dir, "cache", "published.json")
+    state = load_state(state_path, "publish state", {})
+
+    stats = {"files": 0, "changed": 0, "bytes": 0,
+             "minified": 0, "gz": 0, "br": 0}
+    catalog = FeedCatalog(output_dir)
+    new_state = {}
+    for name in published_files(output_dir):
+        path = os.path.join(output_dir, name)
+        with open(path, "rb") as f:
+            data = f.read()
+        stats["files"] += 1
+        stats["bytes"] += len(data)
+
+        if minify and (name.endswith(".xml") or name.endswith(".json")):
+            try:
+                text = data.decode("utf-8")
+                text = minify_xml(text) if name.endswith(
+                    ".xml") else minify_json(text)
+                minified = text.encode("utf-8")
+            except Exception as e:
+                print("Error: " + str(e))
+                print("Not minifying " + name)
+                minified = data
+            if minified != data:
+                writer.write(path, minified, semantic=False)
+                data = minified
+                if name.endswith(".xml"):
+                    catalog.update(name[len("xml/"):], text)
+        stats["minified"] += len(data)
+
+        sha256 = hashlib.sha256(data).hexdigest()
+        new_state[name] = sha256
+        unchanged = state.get(name) == sha256 and os.path.exists(path + ".gz") and \
+            (brotli is None or os.path.exists(path + ".br"))
+        if not unchanged:
+            stats["changed"] += 1
+            # mtime=0, so identical content always compresses to identical bytes
+            writer.write(path + ".gz", gzip.compress(data, 9, mtime=0), semantic=False)
+            if brotli is not None:
+                writer.write(path + ".br", brotli.compress(data), semantic=False)
+        stats["gz"] += os.path.getsize(path + ".gz")
+        if brotli is not None:
+            stats["br"] += os.path.getsize(path + ".br")
+
+    save_state(state_path, new_state)
+    return stats
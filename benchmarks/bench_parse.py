@@ -0,0 +1,86 @@
+"""
+Micro-benchmark: parsing a tj.ustc.edu.cn-like notice list page
+
+Compares the old parseHTML (a full html.parser tree of the page, then find) with
+Site.parse, which only parses the #wp_news_w5 element cut out of the page, with html.parser and with lxml.
+
+Run from the repo root: python -m benchmarks.bench_parse [saved list.htm ...]
+Without arguments, the fixture server's list page is used.
+"""
+import datetime
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+import RSSGenerate.scraper as scraper
+from RSSGenerate.tj_ustc import site
+from benchmarks.server import FixtureServer
+
+
+def full_tree(html: str):
+    """
+    parseHTML before the SoupStrainer fast path
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    ul = soup.find("div", {"id": "wp_news_w5"}).find("ul")
+    result = []
+    for item in ul.find_all("li", {"class": "item"}):
+        date = item.find("time").text
+        result.append({
+            "title": item.find("a").text,
+            "link": 'http://www.tj.ustc.edu.cn' + item.find("a")['href'],
+            "date": datetime.datetime.strptime(date, "%Y-%m-%d").replace(
+                tzinfo=datetime.timezone(datetime.timedelta(hours=8)))
+        })
+    return result
+
+
+def scoped(parser: str):
+    def parse(html: str):
+        scraper.html_parser = parser
+        return site.parse(html)
+    return parse
+
+
+def measure(func, html: str, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(html)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def fixture_page() -> str:
+    server = FixtureServer(entries=20)
+    # the list page links are relative, the server needn't be running
+    return server.tj_list().decode("utf-8")
+
+
+def main():
+    pages = sys.argv[1:]
+    htmls = [open(path, encoding="utf-8").read() for path in pages] if len(pages) > 0 else [fixture_page()]
+    names = pages if len(pages) > 0 else ["fixture list.htm"]
+
+    methods = [("full tree (html.parser)", full_tree), ("scoped (html.parser)", scoped("html.parser"))]
+    try:
+        import lxml
+        methods.append(("scoped (lxml)", scoped("lxml")))
+    except ImportError:
+        print("lxml is not installed, skipping it")
+
+    for name, html in zip(names, htmls):
+        print(f"{name}: {len(html) / 1024:.1f} KiB")
+        print(f"{'method':<26}{'time (ms)':>12}{'items':>8}")
+        expected = None
+        for method, func in methods:
+            result, duration = measure(func, html, 20)
+            links = [item["link"].split("/", 3)[-1] for item in result]
+            if expected is None:
+                expected = links
+            assert links == expected, method + " parsed different items"
+            print(f"{method:<26}{duration * 1000:>12.2f}{len(result):>8}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
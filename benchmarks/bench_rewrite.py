@@ -0,0 +1,84 @@
+"""
+Micro-benchmark: rewriting asset urls in a large synthetic feed
+
+Compares the old behaviour (one str.replace over the whole feed per matched url)
+with RSSBackup.RSS.rewrite_urls (one re.sub over a url -> filename table).
+
+Run from the repo root: python -m benchmarks.bench_rewrite [entries] [images_per_entry]
+"""
+import hashlib
+import sys
+import time
+import tracemalloc
+
+from RSSBackup.RSS import rewrite_urls
+from RSSBackup.extract import extract_urls
+
+hosting_url = "https://rss-cdn.example.com"
+
+
+def make_feed(entries: int, images_per_entry: int):
+    """
+    Make a WeRSS-like feed, every entry has images_per_entry images, half of them shared between entries
+    """
+    items = []
+    for i in range(entries):
+        images = "".join(
+            f'<p>Lorem ipsum dolor sit amet {i}-{j}</p><img src="https://mmbiz.qpic.cn/mmbiz_png/{i if j % 2 else 0}x{j}/640?wx_fmt=png" />'
+            for j in range(images_per_entry))
+        items.append(f"""<item>
+<title>Entry {i}</title>
+<link>https://mp.weixin.qq.com/s/{i}</link>
+<description><![CDATA[{images}]]></description>
+</item>""")
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Synthetic</title>
+{"".join(items)}
+</channel></rss>"""
+
+
+def repeated_replace(original_xml: str, urls: list):
+    for url in urls:
+        filename = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        original_xml = original_xml.replace(
+            url, hosting_url + "/static/" + filename)
+    return original_xml
+
+
+def single_pass(original_xml: str, urls: list):
+    filenames = {url: hashlib.sha256(url.encode("utf-8")).hexdigest()
+                 for url in dict.fromkeys(urls)}
+    return rewrite_urls(original_xml, filenames, hosting_url)
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, duration, peak
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    images_per_entry = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    feed = make_feed(entries, images_per_entry)
+    start = time.perf_counter()
+    urls = list(extract_urls(feed))
+    print(f"Feed: {len(feed) / 1024 / 1024:.1f} MiB, {len(urls)} unique urls, "
+          f"extracted in {time.perf_counter() - start:.3f}s")
+
+    old, old_time, old_peak = measure(repeated_replace, feed, urls)
+    new, new_time, new_peak = measure(single_pass, feed, urls)
+    assert old == new
+
+    print(f"{'method':<20}{'time (s)':>12}{'peak (MiB)':>14}")
+    print(f"{'repeated replace':<20}{old_time:>12.3f}{old_peak / 1024 / 1024:>14.1f}")
+    print(f"{'single pass':<20}{new_time:>12.3f}{new_peak / 1024 / 1024:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
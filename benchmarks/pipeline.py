@@ -0,0 +1,222 @@
+"""
+Benchmark the whole main.main() pipeline against the local FixtureServer, fully offline.
+
+Every run (the first one cold, the following ones warm, reusing the output directory)
+records per stage: wall time, RSS at the start and peak RSS during the stage (sampled every 10ms
+from /proc/self/statm, so Linux only, and without the image optimizer's worker processes),
+and requests / bytes served by the fixture server.
+max_rss_kb is getrusage's ru_maxrss, the peak of the process so far (cumulative, not per stage).
+
+Run from the repo root:
+    python -m benchmarks.pipeline --feeds 9 --entries 20 --assets 10 --latency 0.05 --runs 2 --output bench.json
+"""
+import argparse
+import functools
+import contextlib
+import datetime
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import yaml
+
+import main
+from benchmarks.server import FixtureServer
+
+stages = ["backup_feeds", "generate_feeds", "make_index",
+          "make_old_index_json", "make_new_index_json", "publish_outputs"]
+
+
+def max_rss_kb() -> int:
+    """
+    The peak RSS of the process (or its largest child) since it started
+    """
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def current_rss_kb() -> Optional[int]:
+    """
+    The RSS of the process right now, None if /proc isn't available
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RSSSampler:
+    """
+    Sample the RSS in a background thread while in the with block, to get the peak of that block alone
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start_kb = None
+        self.peak_kb = None
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def sample(self):
+        rss = current_rss_kb()
+        if rss is not None and (self.peak_kb is None or rss > self.peak_kb):
+            self.peak_kb = rss
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.start_kb = current_rss_kb()
+        self.sample()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+        self.sample()
+        return False
+
+
+def diff_counters(before: dict, after: dict) -> dict:
+    result = {}
+    for kind, counter in after.items():
+        old = before.get(kind, {"requests": 0, "bytes": 0})
+        if counter["requests"] != old["requests"]:
+            result[kind] = {"requests": counter["requests"] - old["requests"],
+                            "bytes": counter["bytes"] - old["bytes"]}
+    return result
+
+
+def instrument(server: FixtureServer, records: list):
+    """
+    Wrap every stage function of main, so main.main() records each stage into records
+    """
+    for name in stages:
+        func = getattr(main, name)
+
+        @functools.wraps(func)
+        def timed(config, func=func, name=name):
+            counters = server.snapshot()
+            start = time.perf_counter()
+            sampler = RSSSampler()
+            try:
+                with sampler:
+                    return func(config)
+            finally:
+                records.append({
+                    "stage": name,
+                    "seconds": time.perf_counter() - start,
+                    "rss_start_kb": sampler.start_kb,
+                    "rss_peak_kb": sampler.peak_kb,
+                    "rss_growth_kb": None if sampler.start_kb is None else sampler.peak_kb - sampler.start_kb,
+                    "max_rss_kb": max_rss_kb(),
+                    "served": diff_counters(counters, server.snapshot())
+                })
+        setattr(main, name, timed)
+
+
+def write_config(directory: str, server: FixtureServer, args) -> dict:
+    config = yaml.safe_load(open(os.path.join(os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))), "config.yaml")))
+    config["backup_feeds"] = [{"url": f"{server.url}/feeds/{i}.xml", "xmlFilename": f"fixture_{i}.xml"}
+                              for i in range(args.feeds)]
+    config["generate_feeds"] = [{"name": "tj_ustc", "url": server.url + "/tj/list.htm"}]
+    config["outputDir"] = os.path.join(directory, "output")
+    config["hostingURL"] = "https://rss-cdn.example.com"
+    with open(os.path.join(directory, "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f)
+    return config
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return ""
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feeds", type=int, default=9)
+    parser.add_argument("--entries", type=int, default=20)
+    parser.add_argument("--assets", type=int, default=10,
+                        help="images per entry")
+    parser.add_argument("--asset-size", type=int, default=50 * 1024)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds before every response")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answering 500")
+    parser.add_argument("--dead-rate", type=float, default=0.0,
+                        help="fraction of assets always answering 404")
+    parser.add_argument("--runs", type=int, default=2,
+                        help="the first run is cold, the others warm")
+    parser.add_argument("--output", default="bench.json",
+                        help="json file to write the results to")
+    parser.add_argument("--verbose", action="store_true",
+                        help="show the pipeline's output")
+    args = parser.parse_args()
+
+    server = FixtureServer(feeds=args.feeds, entries=args.entries, assets=args.assets,
+                           asset_size=args.asset_size, latency=args.latency,
+                           error_rate=args.error_rate, dead_rate=args.dead_rate).start()
+
+    records = []
+    instrument(server, records)
+    runs = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        write_config(directory, server, args)
+        os.chdir(directory)
+        try:
+            for run in range(args.runs):
+                records.clear()
+                counters = server.snapshot()
+                start = time.perf_counter()
+                with open(os.devnull, "w") as devnull, \
+                        contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                    main.main()
+                runs.append({
+                    "run": run,
+                    "seconds": time.perf_counter() - start,
+                    "max_rss_kb": max_rss_kb(),
+                    "served": diff_counters(counters, server.snapshot()),
+                    "stages": list(records)
+                })
+        finally:
+            os.chdir(cwd)
+    server.stop()
+
+    result = {
+        "revision": git_revision(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "parameters": vars(args),
+        "runs": runs
+    }
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=4)
+
+    for run in runs:
+        print(f"run {run['run']}: {run['seconds']:.2f}s, max RSS so far {run['max_rss_kb'] / 1024:.1f} MiB")
+        for record in run["stages"]:
+            served = sum(c["requests"] for c in record["served"].values())
+            served_bytes = sum(c["bytes"] for c in record["served"].values())
+            peak = "" if record["rss_peak_kb"] is None else \
+                f"  peak RSS {record['rss_peak_kb'] / 1024:.1f} MiB (+{record['rss_growth_kb'] / 1024:.1f})"
+            print(f"    {record['stage']:<22}{record['seconds']:>8.2f}s"
+                  f"{served:>8} requests{served_bytes:>12} bytes{peak}")
+    print("Results written to " + args.output)
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,162 @@
+"""
+Local HTTP stand-in for the feeds and assets the pipeline downloads, so benchmarks run offline.
+
+Routes:
+    /feeds/<i>.xml      RSS feed i, `entries` entries with `assets` images each (ETag / If-None-Match supported)
+    /assets/<...>.png   an asset of `asset_size` bytes, some are shared between feeds
+    /tj/list.htm        a tj.ustc.edu.cn-like notice list page, `entries` notices per page, newest first
+    /tj/list<n>.htm     page n of the notice list, set `tj_posted` to post new notices
+    /tj/<...>/page.htm  a tj.ustc.edu.cn-like article page
+
+Every response waits `latency` seconds first. `error_rate` of the requests randomly answer 500,
+`dead_rate` of the assets always answer 404.
+"""
+import datetime
+import hashlib
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class FixtureServer:
+    def __init__(self, feeds: int = 9, entries: int = 20, assets: int = 10, asset_size: int = 50 * 1024,
+                 latency: float = 0.05, error_rate: float = 0.0, dead_rate: float = 0.0, seed: int = 0):
+        self.feeds = feeds
+        self.entries = entries
+        self.assets = assets
+        self.asset_size = asset_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.dead_rate = dead_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.server = None
+        # notices posted after the start, they push the others down the list pages
+        self.tj_posted = 0
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:" + str(self.server.server_port)
+
+    def count(self, kind: str, size: int):
+        with self.lock:
+            counter = self.counters.setdefault(
+                kind, {"requests": 0, "bytes": 0})
+            counter["requests"] += 1
+            counter["bytes"] += size
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {kind: dict(counter) for kind, counter in self.counters.items()}
+
+    def is_dead(self, path: str) -> bool:
+        digest = hashlib.sha256(path.encode("utf-8")).digest()
+        return digest[0] / 256 < self.dead_rate
+
+    def feed(self, i: int) -> bytes:
+        items = []
+        for k in range(self.entries):
+            images = "".join(
+                f'&lt;p&gt;Paragraph {j}&lt;/p&gt;&lt;img src="{self.url}/assets/{"shared" if j == 0 else i}/{k}/{j}.png"/&gt;'
+                for j in range(self.assets))
+            items.append(f"""<item>
+<title>Feed {i} entry {k}</title>
+<link>{self.url}/articles/{i}/{k}</link>
+<guid>{self.url}/articles/{i}/{k}</guid>
+<pubDate>Wed, 14 Jun 2023 {k % 24:02d}:00:00 +0800</pubDate>
+<description>{images}</description>
+</item>""")
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel>
+<title>Fixture feed {i}</title>
+<link>{self.url}/feeds/{i}.xml</link>
+<description>Fixture feed {i}</description>
+{"".join(items)}
+</channel></rss>""".encode("utf-8")
+
+    def tj_list(self, page: int = 1) -> bytes:
+        newest = 1000 + self.tj_posted
+        notices = range(newest - (page - 1) * self.entries, max(newest - page * self.entries, 0), -1)
+        items = "".join(f"""
+    <li class="item">
+        <a href="/tj/{date:%Y/%m%d}/c30734a{k}/page.htm"><a href='/tj/{date:%Y/%m%d}/c30734a{k}/page.htm' target='_blank' title='Notice {k}'>Notice {k}</a></a>
+        <time>{date:%Y-%m-%d}</time>
+    </li>""" for k, date in ((k, datetime.date(2020, 1, 1) + datetime.timedelta(days=k)) for k in notices))
+        nav = "".join(
+            f'<li><a href="/nav/{k}">Navigation {k}</a></li>' for k in range(200))
+        return f"""<html><head><script>{"var x = 1;" * 500}</script></head><body>
+<div class="nav"><ul>{nav}</ul></div>
+<div class="section page-xstzcs"><div class="container clearfix"><div class="content pull-right"><div class="content-body">
+<div frag="面板5"><div frag="窗口5" portletmode="simpleList"><div id="wp_news_w5"><ul>{items}
+</ul></div></div></div></div></div></div></div>
+<div class="footer">{"Footer " * 500}</div>
+</body></html>""".encode("utf-8")
+
+    def tj_page(self, path: str) -> bytes:
+        return f"""<html><body><div class="article"><h1 class="arti_title">{path}</h1>
+<div class="wp_articlecontent"><p>{"Article text. " * 200}</p><img src="{self.url}/assets/tj{path}.png"/></div>
+</div></body></html>""".encode("utf-8")
+
+    def handler(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def send(self, status: int, body: bytes, kind: str, headers: dict = {}):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                fixture.count(kind, len(body))
+
+            def do_GET(self):
+                time.sleep(fixture.latency)
+                path = self.path.split("?")[0]
+                kind = path.split("/")[1] if path.count("/") > 1 else "other"
+                with fixture.lock:
+                    failing = fixture.random.random() < fixture.error_rate
+                if failing:
+                    return self.send(500, b"injected error", kind)
+
+                if path.startswith("/feeds/"):
+                    body = fixture.feed(int(path[len("/feeds/"):-len(".xml")]))
+                    etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        return self.send(304, b"", kind, {"ETag": etag})
+                    return self.send(200, body, kind, {"Content-Type": "application/rss+xml", "ETag": etag})
+                if path.startswith("/assets/"):
+                    if fixture.is_dead(path):
+                        return self.send(404, b"not found", kind)
+                    seed = hashlib.sha256(path.encode("utf-8")).digest()
+                    body = b"\x89PNG\r\n\x1a\n" + \
+                        (seed * (fixture.asset_size // len(seed) + 1))[:fixture.asset_size]
+                    return self.send(200, body, kind, {"Content-Type": "image/png"})
+                if path.startswith("/tj/list") and path.endswith(".htm"):
+                    page = path[len("/tj/list"):-len(".htm")]
+                    if page != "" and not page.isdigit():
+                        return self.send(404, b"not found", kind)
+                    return self.send(200, fixture.tj_list(int(page or 1)), kind,
+                                     {"Content-Type": "text/html; charset=utf-8"})
+                if path.startswith("/tj/") and path.endswith("/page.htm"):
+                    return self.send(200, fixture.tj_page(path), kind, {"Content-Type": "text/html; charset=utf-8"})
+                return self.send(404, b"not found", kind)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -3,8 +3,16 @@ import os
 import sys
 import RSSBackup
 import RSSGenerate
-import feedparser
 import json
+import time
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+import Utils.log
+import Utils.publish
+from Utils.http import client
+from Utils.catalog import FeedCatalog
+from Utils.metrics import metrics
+from Utils.output import writer, git_ignore
 
 
 def load_config():
@@ -24,31 +32,184 @@ def backup_feeds(config):
     hosting_URL = config["hostingURL"]
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
+    static_dir = os.path.join(output_dir, "static")
+    if not os.path.exists(static_dir):
+        os.makedirs(static_dir)
+
+    asset_store = RSSBackup.AssetStore(
+        static_dir, os.path.join(output_dir, "cache", "assets.sqlite"))
+    migrated = asset_store.migrate_legacy()
+    if migrated > 0:
+        print("Migrated " + str(migrated) + " legacy static files")
+
+    image_optimizer = None
+    if config.get("optimizeImages", False):
+        try:
+            image_optimizer = RSSBackup.ImageOptimizer(asset_store,
+                                                       format=config.get("imageFormat", "WEBP"),
+                                                       quality=config.get("imageQuality", 80),
+                                                       max_dimension=config.get("imageMaxDimension", 1280),
+                                                       workers=config.get("imageWorkers", 2))
+        except ImportError as e:
+            print("Error: " + str(e))
+            print("Not optimizing images")
+
+    RSSBackup.breaker.threshold = config.get("breakerThreshold", 5)
+    RSSBackup.breaker.cooldown = config.get("breakerCooldown", 1800)
+    RSSBackup.breaker.load(os.path.join(output_dir, "cache", "breakers.json"))
+    RSSBackup.negative.ttl["permanent"] = config.get("negativeTTLPermanent", 86400)
+    RSSBackup.negative.ttl["transient"] = config.get("negativeTTLTransient", 600)
+    RSSBackup.negative.max_ttl = config.get("negativeTTLMax", 30 * 86400)
+    RSSBackup.negative.load(os.path.join(output_dir, "cache", "negative.json"))
+
+    options = {
+        "hosting_URL": hosting_URL,
+        "max_workers": config.get("assetWorkers", 8),
+        "max_workers_per_host": config.get("assetWorkersPerHost", 4),
+        "max_asset_size": config.get("maxAssetSize"),
+        "keep_oversized_url": config.get("keepOversizedURL", True),
+        "asset_store": asset_store,
+        "validator_store": RSSBackup.ValidatorStore(os.path.join(output_dir, "cache", "validators.json")),
+        "catalog": FeedCatalog(output_dir),
+        "minify": config.get("minifyOutput", True),
+        "image_optimizer": image_optimizer,
+        "merge": config.get("mergeFeeds", True),
+        "retention_count": config.get("retentionCount"),
+        "retention_days": config.get("retentionDays")
+    }
 
-    # Backup all feeds
     for feed in config["backup_feeds"]:
+        if not isinstance(feed, str) and not isinstance(feed, dict):
+            print("Invalid feed: " + str(feed))
+            sys.exit(1)
+
+    # Backup all feeds
+    with ThreadPoolExecutor(max_workers=config.get("feedWorkers", 4)) as pool:
+        results = list(pool.map(
+            Utils.log.run_in_context(lambda feed: backup_feed(feed, output_dir, options)),
+            config["backup_feeds"]))
+    asset_store.save()
+    RSSBackup.breaker.save()
+    RSSBackup.negative.save()
+
+    if image_optimizer is not None:
+        image_optimizer.close()
+        stats = image_optimizer.stats
+        print(f"Optimized {stats['optimized']} of {stats['images']} new images: "
+              f"{stats['original_bytes']} -> {stats['optimized_bytes']} bytes")
+    if RSSBackup.inflight.shared > 0:
+        print("Shared " + str(RSSBackup.inflight.shared) +
+              " downloads between feeds")
+    if RSSBackup.negative.saved > 0:
+        print("Saved " + str(RSSBackup.negative.saved) +
+              " downloads of urls known to fail")
+    if RSSBackup.breaker.skipped > 0:
+        print("Skipped " + str(RSSBackup.breaker.skipped) +
+              " downloads from failing hosts")
+    print_backup_summary(results)
+    return results
+
+
+def backup_feed(feed, output_dir: str, options: dict):
+    """
+    Backup one feed of config["backup_feeds"], its output is printed in one piece when done
+
+    :param feed: The feed url, or a dict with url and xmlFilename
+    :param str output_dir: The output directory
+    :param dict options: Keyword arguments for RSSBackup.backupRSSFeed
+
+    :return: The result of backupRSSFeed, with name and duration, status is "failed" if it raised
+    """
+    start = time.time()
+    name = feed if isinstance(feed, str) else feed.get("xmlFilename", feed.get("url"))
+    with Utils.log.group(), metrics.span("backup_feed", feed=name):
         try:
             if isinstance(feed, str):
-                RSSBackup.backupRSSFeed(feedURL=feed,
-                                        output_dir=output_dir,
-                                        hosting_URL=hosting_URL)
-            elif isinstance(feed, dict):
-                RSSBackup.backupRSSFeed(feedURL=feed["url"],
-                                        output_dir=output_dir,
-                                        hosting_URL=hosting_URL,
-                                        xml_filename=feed["xmlFilename"])
+                result = RSSBackup.backupRSSFeed(feedURL=feed,
+                                                 output_dir=output_dir,
+                                                 **options)
             else:
-                print("Invalid feed: " + str(feed))
-                sys.exit(1)
+                result = RSSBackup.backupRSSFeed(feedURL=feed["url"],
+                                                 output_dir=output_dir,
+                                                 xml_filename=feed["xmlFilename"],
+                                                 **options)
         except Exception as e:
             print("Error: " + str(e))
             print("Skipping...")
-            continue
+            result = {"status": "failed", "bytes": 0, "assets": 0, "failed": 0}
+            metrics.count("feeds_failed")
+        finally:
+            options["asset_store"].save()
+            RSSBackup.breaker.save()
+            RSSBackup.negative.save()
+    result["name"] = name
+    result["duration"] = time.time() - start
+    return result
+
+
+def print_backup_summary(results: list):
+    """
+    Print a table of every feed's duration, status, bytes fetched and assets added
+    """
+    width = max([len("feed")] + [len(result["name"]) for result in results])
+    print()
+    print(f"{'feed':<{width}}  {'status':<12}  {'duration':>9}  {'bytes':>12}  {'assets':>6}")
+    for result in results:
+        print(f"{result['name']:<{width}}  {result['status']:<12}  {result['duration']:>8.1f}s  "
+              f"{result['bytes']:>12}  {result['assets']:>6}")
+    print()
 
 
 def generate_feeds(config):
     output_dir = config["outputDir"]
-    RSSGenerate.generate_RSS_feeds(output_dir=output_dir)
+    try:
+        sites = RSSGenerate.load_sites(config.get("generate_feeds"))
+    except ValueError as e:
+        print("Error: " + str(e))
+        sys.exit(1)
+    asset_store = RSSBackup.AssetStore(os.path.join(output_dir, "static"),
+                                       os.path.join(output_dir, "cache", "assets.sqlite"))
+    enrich_options = {
+        "workers": config.get("articleWorkers", 4),
+        "asset_store": asset_store,
+        "hosting_URL": config["hostingURL"],
+        "max_workers": config.get("assetWorkers", 8),
+        "max_workers_per_host": config.get("assetWorkersPerHost", 4),
+        "max_asset_size": config.get("maxAssetSize"),
+        "keep_oversized_url": config.get("keepOversizedURL", True)
+    }
+    warc = None
+    if config.get("warcArticles", False):
+        warc = RSSBackup.WARCWriter(os.path.join(output_dir, "warc"), prefix="articles",
+                                    max_segment_size=config.get("warcSegmentSize", 100 * 1024 * 1024),
+                                    period=config.get("warcPeriod", "%Y%m"))
+        enrich_options["warc"] = warc
+        # segments only grow, committing them would add a new copy to gh-pages on every run
+        git_ignore(output_dir, "/warc/")
+    results = RSSGenerate.generate_all(sites, output_dir,
+                                       minify=config.get("minifyOutput", True),
+                                       max_workers=config.get("generateWorkers", 4),
+                                       enrich_options=enrich_options)
+    if warc is not None:
+        warc.close()
+        print("Archived " + str(warc.records) + " article pages in " + warc.directory)
+    asset_store.save()
+    RSSBackup.negative.save()
+    print_generate_summary(results)
+    return results
+
+
+def print_generate_summary(results: list):
+    """
+    Print a table of every generated site's duration, status, pages fetched, new items, items and error
+    """
+    width = max([len("site")] + [len(result["name"]) for result in results])
+    print()
+    print(f"{'site':<{width}}  {'status':<10}  {'duration':>9}  {'pages':>5}  {'new':>4}  {'items':>6}  error")
+    for result in results:
+        print(f"{result['name']:<{width}}  {result['status']:<10}  {result['duration']:>8.1f}s  "
+              f"{result['pages']:>5}  {result['new']:>4}  {result['items']:>6}  {result.get('error', '')}")
+    print()
 
 
 def make_index(config):
@@ -62,28 +223,22 @@ def make_index(config):
     output_dir = config["outputDir"]
 
     # list all xml files
-    xml_dir = os.path.join(output_dir, "xml")
-    xml_files = os.listdir(xml_dir)
-    xml_files = [os.path.join(xml_dir, f) for f in xml_files]
-    xml_files = [f for f in xml_files if os.path.isfile(f)]
+    feeds = FeedCatalog(output_dir).list()
 
     # make index
-    readme_path = os.path.join(output_dir, "README.md")
-    with open(readme_path, "w") as f:
-        f.write("# RSS Feeds\n\n[![Create feeds](https://github.com/Life-USTC/LU_RSS/actions/workflows/run.yaml/badge.svg)](https://github.com/Life-USTC/LU_RSS/actions/workflows/run.yaml)\n\n")
-        for xml_file in xml_files:
-            xml_file_name = xml_file.split("/")[-1]
-            with open(xml_file, "r") as f2:
-                feed = feedparser.parse(f2.read())
-            title = feed.feed.title if len(
-                feed.feed.title) > 0 else xml_file_name
-            relative_xml_file = xml_file.replace(output_dir, "")
-            f.write(f"""
+    readme = "# RSS Feeds\n\n[![Create feeds](https://github.com/Life-USTC/LU_RSS/actions/workflows/run.yaml/badge.svg)](https://github.com/Life-USTC/LU_RSS/actions/workflows/run.yaml)\n\n"
+    for feed in feeds:
+        xml_file = feed["path"]
+        xml_file_name = feed["filename"]
+        title = feed["title"] if len(feed["title"]) > 0 else xml_file_name
+        relative_xml_file = xml_file.replace(output_dir, "")
+        readme += f"""
 * {title}:
 > [{xml_file_name}]({relative_xml_file})
 >
 > Deployed at: {config['hostingURL']}{relative_xml_file}
-""")
+"""
+    writer.write(os.path.join(output_dir, "README.md"), readme)
 
 
 def make_old_index_json(config):
@@ -106,18 +261,14 @@ def make_old_index_json(config):
     output_dir = config["outputDir"]
 
     # list all xml files
-    xml_dir = os.path.join(output_dir, "xml")
-    xml_files = os.listdir(xml_dir)
-    xml_files = [os.path.join(xml_dir, f) for f in xml_files]
-    xml_files = [f for f in xml_files if os.path.isfile(f)]
+    feeds = FeedCatalog(output_dir).list()
 
     # make index
     feed_list = []
-    for xml_file in xml_files:
-        xml_file_name = xml_file.split("/")[-1]
-        with open(xml_file, "r") as f:
-            feed = feedparser.parse(f.read())
-        title = feed.feed.title if len(feed.feed.title) > 0 else xml_file_name
+    for feed in feeds:
+        xml_file = feed["path"]
+        xml_file_name = feed["filename"]
+        title = feed["title"] if len(feed["title"]) > 0 else xml_file_name
         feed_list.append({
             "name": title,
             "url": "deprecated",
@@ -125,20 +276,124 @@ def make_old_index_json(config):
             "backupURL": config["hostingURL"] + "/backup/xml/" + xml_file_name
         })
 
-    with open(os.path.join(output_dir, "feed_list.json"), "w") as f:
-        f.write(json.dumps(feed_list, indent=4))
+    writer.write(os.path.join(output_dir, "feed_list.json"), json.dumps(feed_list, indent=4))
 
 
 def make_new_index_json(config):
-    pass
+    """
+    Make feed_index.json, so clients poll one small file and only fetch the feeds that changed.
+    Format like this:
+
+    ```json
+    {
+        "version": 1,
+        "feeds": {
+            "mp_ustc_main.xml": {
+                "name": "\u516c\u4f17\u53f7\u300c\u4e2d\u56fd\u79d1\u5b66\u6280\u672f\u5927\u5b66\u300d",
+                "url": "https://rss-cdn.tiankaima.dev/xml/mp_ustc_main.xml",
+                "etag": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08",
+                "updated": "2023-06-14T08:10:00+00:00",
+                "newest": "2023-06-14T08:00:00+00:00",
+                "entries": 20,
+                "latest": [{"title": "...", "link": "https://mp.weixin.qq.com/s/abc"}]
+            }
+        }
+    }
+    ```
+
+    etag is the sha256 of the xml file, updated is when it last changed.
+
+    :param dict config: The config dict
+
+    :return: None
+
+    :description:
+        Built incrementally from the feed catalog: feeds whose sha256 didn't change
+        keep their entry from the last feed_index.json, only changed feeds are updated.
+    """
+    output_dir = config["outputDir"]
+    index_path = os.path.join(output_dir, "feed_index.json")
+    latest = config.get("newIndexLatestEntries", 5)
+
+    previous = {}
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, "r") as f:
+                previous = json.load(f)["feeds"]
+        except Exception as e:
+            print("Error: " + str(e))
+
+    catalog = FeedCatalog(output_dir)
+    now = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+    feeds = {}
+    changed = 0
+    for feed in catalog.list():
+        xml_file_name = feed["filename"]
+        if "sha256" not in feed or "latest" not in feed:
+            # not in the catalog yet, read it once so it is from now on
+            with open(feed["path"], "r") as f:
+                catalog.update(xml_file_name, f.read())
+            feed = {**feed, **catalog.feeds[xml_file_name]}
+
+        old = previous.get(xml_file_name)
+        if old is not None and old["etag"] == feed["sha256"]:
+            feeds[xml_file_name] = old
+            continue
+        changed += 1
+        feeds[xml_file_name] = {
+            "name": feed["title"] if len(feed["title"]) > 0 else xml_file_name,
+            "url": config["hostingURL"] + "/xml/" + xml_file_name,
+            "etag": feed["sha256"],
+            "updated": now,
+            "newest": feed["newest"],
+            "entries": feed["entries"],
+            "latest": feed["latest"][:latest]
+        }
+
+    if changed == 0 and len(feeds) == len(previous):
+        return
+    writer.write(index_path, json.dumps({"version": 1, "feeds": feeds}, indent=4))
+    print("feed_index.json: " + str(changed) + " feeds updated")
+
+
+def publish_outputs(config):
+    """
+    Minify xml and json in outputDir, and write .gz / .br variants of changed files
+
+    :param dict config: The config dict
+
+    :return: None
+    """
+    stats = Utils.publish.publish(config["outputDir"],
+                                  minify=config.get("minifyOutput", True))
+    saved = stats["bytes"] - stats["minified"]
+    print(f"Published {stats['files']} files ({stats['changed']} changed): "
+          f"{stats['bytes']} bytes, minified {stats['minified']} (saved {saved}), "
+          f"gzip {stats['gz']}" + (f", brotli {stats['br']}" if stats["br"] > 0 else ""))
 
 
 def main():
+    metrics.reset()
+    writer.reset()
+    client.reset()
     config = load_config()
-    backup_feeds(config)
-    generate_feeds(config)
-    make_index(config)
-    make_old_index_json(config)
+    for stage in (backup_feeds, generate_feeds, make_index, make_old_index_json,
+                  make_new_index_json, publish_outputs):
+        with metrics.span(stage.__name__):
+            stage(config)
+
+    stats = writer.stats()
+    print(f"Output: {stats['written']} files written, {stats['skipped']} unchanged files skipped")
+    metrics.count("output_files", stats["written"], result="written")
+    metrics.count("output_files", stats["skipped"], result="skipped")
+
+    stats = client.stats()
+    print(f"HTTP: {stats['requests']} requests, {stats['opened']} connections opened, {stats['reused']} reused")
+    metrics.count("http_requests", stats["requests"])
+    metrics.count("http_connections", stats["opened"], state="opened")
+    metrics.count("http_connections", stats["reused"], state="reused")
+    metrics.write(config["outputDir"])
+    print("Metrics written to " + os.path.join(config["outputDir"], "metrics"))
 
 
 if __name__ == "__main__":